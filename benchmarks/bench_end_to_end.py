@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Login, autoload and map/unmap throughput of GlimmerglassDriverHandler against the TL1 simulator.
+
+Needs cloudshell-L1-networking-core ('common' package) importable, the same way as for building the driver:
+PYTHONPATH=../cloudshell-L1-networking-core python benchmarks/bench_end_to_end.py [--latency 0.002]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_FOLDER)
+
+from common.configuration_parser import ConfigurationParser
+
+from benchmarks.tl1_simulator import TL1Simulator, IN_PORT_BASE, OUT_PORT_BASE
+from glimmerglass.async_tcp_session import AsyncTL1Session
+from glimmerglass.glimmerglass_driver_handler import GlimmerglassDriverHandler
+from glimmerglass.tcp_session import GGTCPSession
+
+PORT_COUNTS = [96, 384, 1008]
+PORT_MODES = ['logical', 'physical']
+AUTOLOAD_REPEAT = 3
+MAP_OPERATIONS = 100
+
+
+def port_address(port_mode, port_number, direction):
+    if port_mode == 'logical':
+        return '{0}-{0}'.format(port_number)
+    return str((IN_PORT_BASE if direction == 'in' else OUT_PORT_BASE) + port_number)
+
+
+def run(simulator, port_mode, session_class, command_logger):
+    handler = GlimmerglassDriverHandler()
+    handler._port_logical_mode = port_mode
+    handler._session_class = session_class
+    address = simulator.address
+    result = dict()
+
+    # unique user, so the session pool can't serve the login
+    start_time = time.time()
+    handler.login(address, 'bench{0}'.format(id(handler)), 'password', command_logger)
+    result['login'] = time.time() - start_time
+
+    autoload_times = list()
+    for _ in range(AUTOLOAD_REPEAT):
+        start_time = time.time()
+        handler.get_resource_description(address, command_logger, force_refresh=True)
+        autoload_times.append(time.time() - start_time)
+    result['autoload'] = min(autoload_times)
+
+    start_time = time.time()
+    operations = min(MAP_OPERATIONS, simulator.chassis.port_count / 2)
+    for index in range(operations):
+        src_port = [address, port_address(port_mode, index * 2 + 1, 'in')]
+        dst_port = [address, port_address(port_mode, index * 2 + 2, 'out')]
+        handler.map_uni(src_port, dst_port, command_logger)
+        handler.map_clear_to(src_port, dst_port, command_logger)
+    result['map_rate'] = operations * 2 / (time.time() - start_time)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0, help='simulated device latency per command, seconds')
+    parser.add_argument('--chunk-size', type=int, default=1460)
+    parser.add_argument('--chunk-delay', type=float, default=0)
+    parser.add_argument('--connection-type', choices=['tcp', 'tcp_async'], default='tcp')
+    args = parser.parse_args()
+
+    ConfigurationParser.set_root_folder(ROOT_FOLDER)
+    ConfigurationParser.init()
+    command_logger = logging.getLogger('bench')
+    session_class = AsyncTL1Session if args.connection_type == 'tcp_async' else GGTCPSession
+
+    print '{0:>6} {1:>9} {2:>10} {3:>13} {4:>12}'.format('ports', 'mode', 'login, ms', 'autoload, ms', 'maps/sec')
+    for port_count in PORT_COUNTS:
+        simulator = TL1Simulator(port_count, latency=args.latency, chunk_size=args.chunk_size,
+                                 chunk_delay=args.chunk_delay).start()
+        try:
+            for port_mode in PORT_MODES:
+                result = run(simulator, port_mode, session_class, command_logger)
+                print '{0:>6} {1:>9} {2:>10.1f} {3:>13.1f} {4:>12.1f}'.format(port_count, port_mode,
+                                                                            result['login'] * 1000,
+                                                                            result['autoload'] * 1000,
+                                                                            result['map_rate'])
+        finally:
+            simulator.shutdown()
+            simulator.server_close()
+
+
+if __name__ == '__main__':
+    main()
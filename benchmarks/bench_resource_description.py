@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""get_resource_description time and peak memory, ResourceInfo tree against streamed XML.
+
+Each measurement runs in its own process so peak RSS isn't shared, the XML of both paths is compared by
+digest. Needs 'common' package importable:
+PYTHONPATH=../cloudshell-L1-networking-core python benchmarks/bench_resource_description.py
+"""
+
+import argparse
+import hashlib
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_FOLDER)
+
+PORT_COUNTS = [96, 1008, 4000]
+PORT_MODES = ['logical', 'physical']
+REPEAT = 5
+
+
+def measure(port_count, port_mode, stream):
+    from common.configuration_parser import ConfigurationParser
+
+    from benchmarks import tl1_responses
+    from glimmerglass.glimmerglass_driver_handler import GlimmerglassDriverHandler
+    from glimmerglass.topology_cache import TopologyCache
+
+    ConfigurationParser.set_root_folder(ROOT_FOLDER)
+    ConfigurationParser.init()
+
+    handler = GlimmerglassDriverHandler()
+    handler._port_logical_mode = port_mode
+    handler._stream_resource_description = stream
+    handler._topology_cache = TopologyCache(3600)
+    handler._topology_cache.put(handler._parse_topology({
+        'system_info': tl1_responses.system_info(1, port_count),
+        'switch_size': port_count * 2,
+        'port_list': tl1_responses.port_list(2, port_count),
+        'connections_map': tl1_responses.connections_map(3, port_count)
+    }))
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    elapsed = list()
+    digest = None
+    for _ in range(REPEAT):
+        start_time = time.time()
+        resource_description = handler.get_resource_description('192.168.1.10')
+        elapsed.append(time.time() - start_time)
+        digest = hashlib.sha1(resource_description).hexdigest()
+        del resource_description
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print min(elapsed), rss_peak - rss_before, digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--measure', nargs=3, metavar=('PORTS', 'MODE', 'STREAM'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(int(args.measure[0]), args.measure[1], args.measure[2] == 'stream')
+        return
+
+    print '{0:>6} {1:>9} {2:>8} {3:>10} {4:>14}'.format('ports', 'mode', 'path', 'time, ms', 'peak RSS, KB')
+    for port_count in PORT_COUNTS:
+        for port_mode in PORT_MODES:
+            digests = dict()
+            for path in ('tree', 'stream'):
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                                  '--measure', str(port_count), port_mode, path])
+                elapsed, rss, digests[path] = output.split()
+                print '{0:>6} {1:>9} {2:>8} {3:>10.2f} {4:>14}'.format(port_count, port_mode, path,
+                                                                       float(elapsed) * 1000, rss)
+            assert digests['tree'] == digests['stream'], \
+                'Streamed XML differs from ResourceInfo XML, {0} ports, {1} mode'.format(port_count, port_mode)
+
+
+if __name__ == '__main__':
+    main()
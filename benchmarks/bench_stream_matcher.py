@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Prompt matching over a large rtrv-crs-fiber response delivered in small reads,
+accumulated string search against glimmerglass.stream_matcher.StreamMatcher.
+
+Usage: python benchmarks/bench_stream_matcher.py
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks import tl1_responses
+from glimmerglass.stream_matcher import StreamMatcher
+
+PROMPT = r";\s*<"
+CHUNK_SIZES = [512, 1460]
+PORT_COUNTS = [1000, 4000, 16000]
+
+
+def accumulate(chunks):
+    output_str = ''
+    for chunk in chunks:
+        output_str += chunk
+        if re.search(PROMPT, output_str, re.DOTALL):
+            return output_str
+
+
+def stream(chunks):
+    output_matcher = StreamMatcher()
+    for chunk in chunks:
+        output_matcher.feed(chunk)
+        if output_matcher.search(PROMPT):
+            return output_matcher.getvalue()
+
+
+def measure(function, chunks):
+    start_time = time.time()
+    output = function(chunks)
+    return time.time() - start_time, output
+
+
+def main():
+    print '{0:>8} {1:>10} {2:>8} {3:>16} {4:>14}'.format('ports', 'size, KB', 'chunk', 'accumulated, ms',
+                                                           'streaming, ms')
+    for port_count in PORT_COUNTS:
+        response = tl1_responses.connections_map(1, port_count)
+        for chunk_size in CHUNK_SIZES:
+            chunks = [response[index:index + chunk_size] for index in range(0, len(response), chunk_size)]
+            accumulated_time, accumulated_output = measure(accumulate, chunks)
+            streaming_time, streaming_output = measure(stream, chunks)
+            assert accumulated_output == streaming_output == response
+            print '{0:>8} {1:>10} {2:>8} {3:>16.2f} {4:>14.2f}'.format(port_count, len(response) / 1024, chunk_size,
+                                                                       accumulated_time * 1000,
+                                                                       streaming_time * 1000)
+
+
+if __name__ == '__main__':
+    main()
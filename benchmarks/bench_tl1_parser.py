@@ -0,0 +1,48 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Parse time of RTRV-CFG-FIBER and rtrv-crs-fiber dumps against the port count.
+
+Usage: python benchmarks/bench_tl1_parser.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks import tl1_responses
+from glimmerglass import tl1_parser
+
+PORT_COUNTS = [96, 384, 1000, 2000, 4000]
+REPEAT = 5
+
+
+def measure(port_count):
+    port_list = tl1_responses.port_list(1, port_count)
+    connections_map = tl1_responses.connections_map(2, port_count)
+
+    def parse():
+        tl1_parser.parse_ports(port_list)
+        tl1_parser.parse_connections(connections_map)
+
+    return min(timeit.repeat(parse, number=1, repeat=REPEAT))
+
+
+def main():
+    print '{0:>8} {1:>12} {2:>16}'.format('ports', 'total, ms', 'per port, us')
+    per_port_times = []
+    for port_count in PORT_COUNTS:
+        elapsed = measure(port_count)
+        per_port_times.append(elapsed / port_count)
+        print '{0:>8} {1:>12.3f} {2:>16.3f}'.format(port_count, elapsed * 1000, elapsed * 1000000 / port_count)
+
+    # linear growth keeps the per-port cost flat, allow some noise
+    growth = per_port_times[-1] / per_port_times[0]
+    print 'per port cost growth {0}->{1} ports: x{2:.2f}'.format(PORT_COUNTS[0], PORT_COUNTS[-1], growth)
+    return 0 if growth < 2 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Synthetic Glimmerglass TL1 responses, shaped like the output of the real chassis"""
+
+RESPONSE_HEADER = '\r\n\r\n   "GG-SIM" 16-12-19 12:00:00\r\nM  {ctag} COMPLD\r\n'
+RESPONSE_FOOTER = ';\r\n<'
+AUTONOMOUS_HEADER = '\r\n\r\n   "GG-SIM" 16-12-19 12:00:00\r\nA  {atag} REPT {verb}\r\n'
+
+
+def system_info(ctag, port_count):
+    return (RESPONSE_HEADER.format(ctag=ctag) +
+            '   "SerialNumber=GG0001234"\r\n'
+            '   "SystemType=Photonic"\r\n'
+            '   "Glimmerglass:ChassisType=MEMS-{0}"\r\n'
+            '   "SoftwareActiveVersion=7.2.1"\r\n'
+            '   "LicensedPortMatrix={0}x{0}"\r\n'.format(port_count) +
+            RESPONSE_FOOTER)
+
+
+def port_line(port_id, port_name, health='good'):
+    return '   "PORTID={0},PORTNAME={1},PORTHEALTH={2},PORTPOWER=-3.20"\r\n'.format(port_id, port_name, health)
+
+
+def connection_line(src_port, dst_port):
+    return ('   "IPORTID={0},IPORTNAME=IN{1},IPORTPOWER=-3.10,'
+            'OPORTID={2},OPORTNAME=OUT{3},OPORTPOWER=-4.00,CONNSTATE=steady"\r\n').format(src_port, src_port - 10000,
+                                                                                     dst_port, dst_port - 20000)
+
+
+def port_list(ctag, port_count):
+    lines = [RESPONSE_HEADER.format(ctag=ctag)]
+    for port_number in range(1, port_count + 1):
+        lines.append(port_line(10000 + port_number, 'IN{0}'.format(port_number)))
+    for port_number in range(1, port_count + 1):
+        lines.append(port_line(20000 + port_number, 'OUT{0}'.format(port_number)))
+    lines.append(RESPONSE_FOOTER)
+    return ''.join(lines)
+
+
+def connections_map(ctag, port_count):
+    """Every odd input is connected to the next even output"""
+
+    lines = [RESPONSE_HEADER.format(ctag=ctag)]
+    for port_number in range(1, port_count, 2):
+        lines.append(connection_line(10000 + port_number, 20000 + port_number + 1))
+    lines.append(RESPONSE_FOOTER)
+    return ''.join(lines)
+
+
+def autonomous_message(atag, verb, lines):
+    return AUTONOMOUS_HEADER.format(atag=atag, verb=verb) + ''.join(lines) + ';\r\n'
@@ -0,0 +1,256 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Glimmerglass TL1 device simulator
+
+Speaks the TL1 subset used by the driver: ACT-USER, rtrv-hdr, rtrv-system-info, RTRV-CFG-FIBER, rtrv-crs-fiber,
+ent-crs-fiber and dlt-crs-fiber. Logical ports N are IN port 10000+N and OUT port 20000+N. With autonomous messages
+on, cross-connect and port health changes are reported to the other connections as 'REPT DBCHG'/'REPT EVT FIBER'.
+
+Usage: python benchmarks/tl1_simulator.py [--ports 1000] [--port 10034] [--latency 0.005] [--chunk-size 1460]
+"""
+
+import SocketServer
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks import tl1_responses
+
+IN_PORT_BASE = 10000
+OUT_PORT_BASE = 20000
+
+
+class SimulatedChassis(object):
+    """Cross-connect matrix shared by all simulator connections"""
+
+    def __init__(self, port_count):
+        self.port_count = port_count
+        self.lock = threading.Lock()
+        self.health = dict()
+        for port_number in range(1, port_count + 1):
+            self.health[IN_PORT_BASE + port_number] = 'good'
+            self.health[OUT_PORT_BASE + port_number] = 'good'
+        # OUT port id -> IN port id
+        self.connections = dict()
+        # callable(verb, lines, origin) reporting changes
+        self.report = None
+
+    def _report(self, verb, lines, origin=None):
+        if self.report is not None and lines:
+            self.report(verb, lines, origin)
+
+    @staticmethod
+    def port_name(port_id):
+        if port_id > OUT_PORT_BASE:
+            return 'OUT{0}'.format(port_id - OUT_PORT_BASE)
+        return 'IN{0}'.format(port_id - IN_PORT_BASE)
+
+    def parse_aids(self, aids):
+        """'all', '10001&10002' or '10001&&10010' to a list of port ids"""
+
+        if not aids or aids.lower() == 'all':
+            return sorted(self.health)
+
+        port_ids = list()
+        index = 0
+        items = aids.split('&')
+        while index < len(items):
+            if items[index] == '' and port_ids and index + 1 < len(items):
+                port_ids.extend(range(port_ids[-1] + 1, int(items[index + 1]) + 1))
+                index += 2
+                continue
+            port_ids.append(int(items[index]))
+            index += 1
+        return port_ids
+
+    def port_lines(self, aids):
+        return [tl1_responses.port_line(port_id, self.port_name(port_id), self.health[port_id])
+                for port_id in self.parse_aids(aids) if port_id in self.health]
+
+    def connection_lines(self, aids):
+        with self.lock:
+            connections = sorted(self.connections.iteritems())
+        if aids and aids.lower() != 'all':
+            port_ids = set(self.parse_aids(aids))
+            connections = [(dst, src) for dst, src in connections if dst in port_ids or src in port_ids]
+        return [tl1_responses.connection_line(src, dst) for dst, src in connections]
+
+    def connect(self, in_aids, out_aids, origin=None):
+        in_ports = self.parse_aids(in_aids)
+        out_ports = self.parse_aids(out_aids)
+        with self.lock:
+            if len(in_ports) != len(out_ports) or \
+                    any(port not in self.health for port in in_ports + out_ports) or \
+                    any(port in self.connections for port in out_ports) or \
+                    any(port in self.connections.values() for port in in_ports):
+                return False
+            for in_port, out_port in zip(in_ports, out_ports):
+                self.connections[out_port] = in_port
+        self._report('DBCHG', ['   "ENT-CRS-FIBER"\r\n'] + [tl1_responses.connection_line(in_port, out_port)
+                                                          for in_port, out_port in zip(in_ports, out_ports)], origin)
+        return True
+
+    def disconnect(self, in_aids, origin=None):
+        in_ports = set(self.parse_aids(in_aids))
+        removed = list()
+        with self.lock:
+            if any(port not in self.health for port in in_ports):
+                return False
+            for out_port, in_port in self.connections.items():
+                if in_port in in_ports:
+                    del self.connections[out_port]
+                    removed.append(tl1_responses.connection_line(in_port, out_port))
+        self._report('DBCHG', ['   "DLT-CRS-FIBER"\r\n'] + removed if removed else [], origin)
+        return True
+
+    def set_health(self, port_id, health):
+        """Change port health, as a port failure on the device would"""
+
+        self.health[port_id] = health
+        self._report('EVT FIBER', [tl1_responses.port_line(port_id, self.port_name(port_id), health)])
+
+
+class TL1RequestHandler(SocketServer.BaseRequestHandler):
+    def setup(self):
+        self.send_lock = threading.Lock()
+        self.server.add_connection(self)
+
+    def finish(self):
+        self.server.remove_connection(self)
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        buffer_str = ''
+        while True:
+            data = self.request.recv(4096)
+            if not data:
+                return
+            buffer_str += data
+            while ';' in buffer_str:
+                command, buffer_str = buffer_str.split(';', 1)
+                self.execute(command.strip())
+
+    def send_response(self, response):
+        chunk_size = self.server.chunk_size
+        with self.send_lock:
+            for index in range(0, len(response), chunk_size):
+                self.request.sendall(response[index:index + chunk_size])
+                if self.server.chunk_delay:
+                    time.sleep(self.server.chunk_delay)
+
+    def execute(self, command):
+        fields = command.split(':')
+        verb = fields[0].lower()
+        aids = fields[2] if len(fields) > 2 else ''
+        ctag = fields[3] if len(fields) > 3 else '0'
+        chassis = self.server.chassis
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        completed = True
+        lines = list()
+        if verb == 'rtrv-system-info':
+            self.send_response(tl1_responses.system_info(ctag, chassis.port_count))
+            return
+        elif verb == 'rtrv-cfg-fiber':
+            lines = chassis.port_lines(aids)
+        elif verb == 'rtrv-crs-fiber':
+            lines = chassis.connection_lines(aids)
+        elif verb == 'ent-crs-fiber':
+            in_aids, _, out_aids = aids.partition(',')
+            completed = chassis.connect(in_aids, out_aids, origin=self)
+        elif verb == 'dlt-crs-fiber':
+            completed = chassis.disconnect(aids, origin=self)
+        elif verb not in ('act-user', 'rtrv-hdr'):
+            completed = False
+
+        header = tl1_responses.RESPONSE_HEADER.format(ctag=ctag)
+        if not completed:
+            header = header.replace('COMPLD', 'DENY')
+            lines = ['   IIAC\r\n']
+        self.send_response(header + ''.join(lines) + tl1_responses.RESPONSE_FOOTER)
+
+
+class TL1Simulator(SocketServer.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port_count=96, host='127.0.0.1', port=0, latency=0, chunk_size=1460, chunk_delay=0,
+                 autonomous_messages=False):
+        """
+        :param port_count: logical ports, each one has IN and OUT port
+        :param port: TCP port to listen on, 0 picks a free one
+        :param latency: seconds before answering each command
+        :param chunk_size: responses are sent in chunks of this size
+        :param chunk_delay: seconds between chunks
+        :param autonomous_messages: report changes to other connections
+        """
+
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), TL1RequestHandler)
+        self.chassis = SimulatedChassis(port_count)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self._connections_lock = threading.Lock()
+        self._connections = list()
+        self._atag = 0
+        if autonomous_messages:
+            self.chassis.report = self.report
+
+    def add_connection(self, connection):
+        with self._connections_lock:
+            self._connections.append(connection)
+
+    def remove_connection(self, connection):
+        with self._connections_lock:
+            self._connections.remove(connection)
+
+    def report(self, verb, lines, origin=None):
+        with self._connections_lock:
+            self._atag += 1
+            message = tl1_responses.autonomous_message(self._atag, verb, lines)
+            connections = [connection for connection in self._connections if connection is not origin]
+
+        for connection in connections:
+            try:
+                connection.send_response(message)
+            except socket.error:
+                pass
+
+    @property
+    def address(self):
+        return '{0}:{1}'.format(*self.server_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='TL1Simulator')
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Glimmerglass TL1 device simulator')
+    parser.add_argument('--ports', type=int, default=96)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=10034)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--chunk-size', type=int, default=1460)
+    parser.add_argument('--chunk-delay', type=float, default=0)
+    parser.add_argument('--autonomous-messages', action='store_true')
+    args = parser.parse_args()
+
+    simulator = TL1Simulator(args.ports, args.host, args.port, args.latency, args.chunk_size, args.chunk_delay,
+                             args.autonomous_messages)
+    print 'Simulating {0} ports on {1}'.format(args.ports, simulator.address)
+    simulator.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -25,7 +25,9 @@ a = Analysis(['main.py'],
                 "common.cli.telnet_session",
                 "common.cli.console_session",
                 "common.cli.ssh_session",
-                "glimmerglass.glimmerglass_driver_handler"
+                "glimmerglass.glimmerglass_driver_handler",
+                "glimmerglass.dispatching_driver_handler",
+                "glimmerglass.async_tcp_session"
              ],
              hookspath=None,
              runtime_hooks=None,
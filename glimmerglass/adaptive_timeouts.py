@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from glimmerglass.command_statistics import command_type, percentile, run_periodically
+from glimmerglass.file_helper import write_file_atomically
+
+
+def _aid_count(aids):
+    """Number of AIDs in the first AID list of a TL1 AID block, '10001&&10003&10007,20001&&20004' -> 4"""
+
+    count = 0
+    for item in aids.split(',')[0].replace('&&', '..').split('&'):
+        first, _, last = item.partition('..')
+        try:
+            count += int(last) - int(first) + 1 if last else 1
+        except ValueError:
+            count += 1
+    return count
+
+
+def command_key(command):
+    """Learning key of a command, TL1 verb with '::all' for whole-chassis commands and the AID count rounded up to
+    a power of two for commands of several AIDs
+
+    'rtrv-crs-fiber::all:5;' -> 'rtrv-crs-fiber::all', 'ent-crs-fiber::10001,20002:6;' -> 'ent-crs-fiber',
+    'ent-crs-fiber::10001&10002&10003,20004&20005&20006:7;' -> 'ent-crs-fiber#4'
+    """
+
+    fields = command.split(':')
+    if len(fields) < 3 or not fields[2].strip():
+        return command_type(command)
+    if fields[2].strip().lower() == 'all':
+        return command_type(command) + '::all'
+
+    size = 1
+    while size < _aid_count(fields[2]):
+        size *= 2
+    return command_type(command) if size == 1 else '{0}#{1}'.format(command_type(command), size)
+
+
+class _Observations(object):
+    def __init__(self, max_samples):
+        self.durations = deque(maxlen=max_samples)
+        self.sizes = deque(maxlen=max_samples)
+        self.timeouts_count = 0
+
+
+class AdaptiveTimeouts(object):
+    """Command timeouts derived from observed response times per device and command key
+
+    Until 'min_samples' responses of a key are observed on a device its commands get the caller default. Then the
+    timeout is 'multiplier' times the 99th percentile response time plus 'margin' seconds, kept between
+    'min_timeout' and 'max_timeout', so a lost response of a small command is detected quickly while a large
+    retrieval still gets the time it usually needs on that device. Commands of many AIDs, like merged cross-connects,
+    are learned apart from single-AID ones, see command_key(), and get the default until their own responses are
+    observed. Commands are never sent again after a timeout, the late response of the first one would be taken for
+    the response of the next command.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.min_samples = 20
+        self.multiplier = 3.0
+        self.margin = 2.0
+        self.min_timeout = 5
+        self.max_timeout = 120
+        self._max_samples = 256
+
+        self._lock = threading.Lock()
+        self._observations = dict()
+        self._save_thread = None
+
+    def configure(self, enabled=False, min_samples=None, multiplier=None, margin=None, min_timeout=None,
+                  max_timeout=None, max_samples=None, save_interval=0, save_folder=None):
+        """
+        :param enabled: derive timeouts from observations, callers get their defaults otherwise
+        :param min_timeout: lowest derived timeout, seconds
+        :param max_timeout: ceiling of a derived timeout and of the default, seconds
+        :param save_interval: seconds between saves of observations, 0 disables saving
+        :param save_folder: folder for glimmerglass_timeouts.json, observations saved there are loaded at once
+        """
+
+        self.enabled = enabled
+        self.min_samples = min_samples or self.min_samples
+        self.multiplier = multiplier or self.multiplier
+        self.margin = margin if margin is not None else self.margin
+        self.min_timeout = min_timeout or self.min_timeout
+        self.max_timeout = max_timeout or self.max_timeout
+        self._max_samples = max_samples or self._max_samples
+
+        if enabled and save_interval and save_folder:
+            self.load(save_folder)
+            if self._save_thread is None:
+                self._save_thread = run_periodically(lambda: self.save(save_folder), save_interval,
+                                                     'AdaptiveTimeoutsSave')
+
+    def _get_observations(self, device, key):
+        device_observations = self._observations.setdefault(device, dict())
+        observations = device_observations.get(key)
+        if observations is None:
+            observations = device_observations[key] = _Observations(self._max_samples)
+        return observations
+
+    def observe(self, device, command, duration, received_bytes=0):
+        """Record the response time and size of a command
+
+        :param device: device address the command was sent to
+        """
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            observations = self._get_observations(device, command_key(command))
+            observations.durations.append(duration)
+            observations.sizes.append(received_bytes)
+
+    def observe_timeout(self, device, command):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._get_observations(device, command_key(command)).timeouts_count += 1
+
+    def _derived_timeout(self, observations):
+        if observations is None or len(observations.durations) < self.min_samples:
+            return None
+
+        timeout = percentile(observations.durations, 0.99) * self.multiplier + self.margin
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def timeout(self, device, command, default):
+        """Seconds to wait for the response of a command
+
+        :param device: device address the command is sent to
+        :param default: timeout used until enough responses are observed
+        """
+
+        if not self.enabled:
+            return default
+
+        with self._lock:
+            timeout = self._derived_timeout(self._observations.get(device, dict()).get(command_key(command)))
+        return timeout if timeout is not None else min(default, self.max_timeout)
+
+    def get_statistics(self):
+        """Observations and derived values per device and command key, times in seconds"""
+
+        with self._lock:
+            result = dict()
+            for device, device_observations in self._observations.iteritems():
+                for key, observations in device_observations.iteritems():
+                    result.setdefault(device, dict())[key] = {
+                        'samples': len(observations.durations),
+                        'p50': percentile(observations.durations, 0.50),
+                        'p99': percentile(observations.durations, 0.99),
+                        'bytes_p99': percentile(observations.sizes, 0.99),
+                        'timeouts': observations.timeouts_count,
+                        'timeout': self._derived_timeout(observations)
+                    }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._observations = dict()
+
+    def save(self, folder):
+        with self._lock:
+            content = dict((device, dict((key, {'durations': list(observations.durations),
+                                                'sizes': list(observations.sizes)})
+                                         for key, observations in device_observations.iteritems()))
+                           for device, device_observations in self._observations.iteritems())
+
+        write_file_atomically(os.path.join(folder, 'glimmerglass_timeouts.json'),
+                              lambda timeouts_file: json.dump({'time': time.time(), 'devices': content}, timeouts_file,
+                                                              sort_keys=True))
+
+    def load(self, folder):
+        file_path = os.path.join(folder, 'glimmerglass_timeouts.json')
+        if not os.path.exists(file_path):
+            return
+
+        try:
+            with open(file_path) as timeouts_file:
+                content = json.load(timeouts_file)
+        except Exception:
+            logging.getLogger(__name__).warning('Failed to load command timeouts', exc_info=True)
+            return
+
+        with self._lock:
+            for device, device_samples in content.get('devices', dict()).iteritems():
+                for key, samples in device_samples.iteritems():
+                    observations = self._get_observations(str(device), str(key))
+                    observations.durations.extend(samples['durations'])
+                    observations.sizes.extend(samples['sizes'])
+
+
+command_timeouts = AdaptiveTimeouts()
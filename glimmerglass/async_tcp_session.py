@@ -0,0 +1,462 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import errno
+import logging
+import re
+import select
+import socket
+import threading
+import time
+
+from common.cli.exceptions import SessionLoopLimitException, CommandExecutionException
+from common.cli.helper.normalize_buffer import normalize_buffer
+from common.configuration_parser import ConfigurationParser
+from glimmerglass.adaptive_timeouts import command_timeouts
+from glimmerglass.command_statistics import statistics, command_type
+from glimmerglass.stream_matcher import StreamMatcher
+from glimmerglass.tl1_pipeline import TL1ResponseDemultiplexer, command_ctag, drop_stale_responses
+
+
+def _socket_pair():
+    if hasattr(socket, 'socketpair'):
+        return socket.socketpair()
+
+    # no socketpair on Windows with python 2
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        writer = socket.create_connection(listener.getsockname())
+        reader, _ = listener.accept()
+    finally:
+        listener.close()
+    return reader, writer
+
+
+class TL1EventLoop(object):
+    """Single thread doing non-blocking socket I/O for all AsyncTL1Session instances of the process
+
+    Callers hand commands over with call_soon and wait on an event, the loop writes them, feeds received data to
+    the session waiting for it and fails waits which passed their deadline.
+    """
+
+    _shared_loop = None
+    _shared_loop_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = list()
+        self._sessions = dict()
+        self._wakeup_reader, self._wakeup_writer = _socket_pair()
+        self._wakeup_reader.setblocking(0)
+        self._wakeup_writer.setblocking(0)
+        self._thread = None
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_loop_lock:
+            if cls._shared_loop is None:
+                cls._shared_loop = cls()
+                cls._shared_loop.start()
+            return cls._shared_loop
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='TL1EventLoop')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def call_soon(self, callback, *args):
+        with self._lock:
+            self._callbacks.append((callback, args))
+        try:
+            self._wakeup_writer.send(b'\0')
+        except socket.error:
+            pass
+
+    def add_session(self, sock, session):
+        self._sessions[sock] = session
+
+    def remove_session(self, sock):
+        self._sessions.pop(sock, None)
+
+    def _run_callbacks(self):
+        with self._lock:
+            callbacks = self._callbacks
+            self._callbacks = list()
+
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception:
+                logging.getLogger(__name__).exception('TL1 event loop callback failed')
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def _run(self):
+        while True:
+            self._run_callbacks()
+
+            deadlines = [session.deadline for session in self._sessions.values() if session.deadline is not None]
+            timeout = max(min(deadlines) - time.time(), 0) if deadlines else None
+            writers = [sock for sock, session in self._sessions.iteritems() if session.has_output()]
+            readers = [self._wakeup_reader] + self._sessions.keys()
+
+            try:
+                readable, writable, _ = select.select(readers, writers, [], timeout)
+            except (select.error, socket.error) as error:
+                if error.args[0] == errno.EINTR:
+                    continue
+                # one of the sockets got closed under us, let sessions find out which
+                readable, writable = self._sessions.keys(), list()
+
+            for sock in readable:
+                if sock is self._wakeup_reader:
+                    self._drain_wakeup()
+                elif sock in self._sessions:
+                    self._sessions[sock].on_readable(sock)
+
+            for sock in writable:
+                if sock in self._sessions:
+                    self._sessions[sock].on_writable(sock)
+
+            now = time.time()
+            for session in self._sessions.values():
+                session.check_deadline(now)
+
+
+class _ExpectWaiter(object):
+    def __init__(self, re_string, timeout, overlap, ctag=None):
+        self.re_string = re_string
+        self.ctag = ctag
+        self.timeout = timeout
+        self.deadline = time.time() + timeout
+        self.matcher = StreamMatcher(overlap)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def feed(self, data):
+        self.matcher.feed(data)
+        if self.matcher.search(self.re_string):
+            # a response to an earlier command which timed out may come first
+            complete, output = drop_stale_responses(self.matcher.getvalue(), self.re_string, self.ctag)
+            if complete:
+                self.finish(output)
+            else:
+                self.matcher.reset()
+                self.matcher.feed(output)
+
+    def check_deadline(self, now):
+        if now >= self.deadline:
+            self.fail(SessionLoopLimitException(AsyncTL1Session.__name__,
+                                                'No expected prompt in {} seconds'.format(self.timeout)))
+
+    def finish(self, result):
+        self.result = result
+        self.done.set()
+
+    def fail(self, error):
+        self.error = error
+        self.done.set()
+
+
+class _PipelineWaiter(_ExpectWaiter):
+    def __init__(self, ctags, timeouts):
+        _ExpectWaiter.__init__(self, None, 0, 0)
+        now = time.time()
+        self.demultiplexer = TL1ResponseDemultiplexer(ctags)
+        self.deadlines = dict((str(ctag), now + timeout) for ctag, timeout in zip(ctags, timeouts))
+        self.deadline = min(self.deadlines.values())
+        self.responses = dict()
+        self.start_time = now
+        self.response_times = dict()
+
+    def feed(self, data):
+        for ctag, status, response in self.demultiplexer.feed(data):
+            self.responses[ctag] = response
+            self.response_times[ctag] = time.time()
+            del self.deadlines[ctag]
+
+        if self.deadlines:
+            self.deadline = min(self.deadlines.values())
+        else:
+            self.finish(self.responses)
+
+    def check_deadline(self, now):
+        timed_out = [ctag for ctag, deadline in self.deadlines.iteritems() if deadline <= now]
+        if timed_out:
+            self.fail(SessionLoopLimitException(AsyncTL1Session.__name__,
+                                                'No response for ctag {}'.format(', '.join(sorted(timed_out)))))
+
+
+class AsyncTL1Session(object):
+    """TL1 session doing its I/O on the shared TL1EventLoop instead of polling a blocking socket
+
+    Keeps the connect/send_command/send_pipelined contract of GGTCPSession, so one driver process can drive many
+    chassis without a polling thread per device.
+    """
+
+    _receive_size = 65536
+    _connect_timeout = 30
+    _command_timeout = 120
+    _match_overlap = 1024
+    # unsolicited data kept between commands, dropped when the next command starts
+    _unsolicited_limit = 65536
+
+    def __init__(self, loop=None, logger=None):
+        self._loop = loop or TL1EventLoop.shared()
+        self.logger = logger or logging.getLogger(__name__)
+        self._command_lock = threading.Lock()
+
+        self.socket = None
+        self._output = ''
+        self._unsolicited = ''
+        # notified when unsolicited data comes or the connection is lost
+        self._unsolicited_condition = threading.Condition()
+        self._waiter = None
+
+        self._host = None
+        self._port = None
+        self._password = ''
+        self._login_command = None
+        self._login_prompt = ''
+
+    @property
+    def _device(self):
+        """Device address learned command timeouts are kept for"""
+
+        return '{0}:{1}'.format(self._host, self._port)
+
+    @property
+    def deadline(self):
+        waiter = self._waiter
+        return waiter.deadline if waiter is not None else None
+
+    def has_output(self):
+        return len(self._output) > 0
+
+    def is_alive(self):
+        """False once the device has closed the connection, the event loop drops the socket then"""
+
+        return self.socket is not None
+
+    def connect(self, host, username, password, command=None, error_map=None, action_map=None, port=None,
+                re_string=''):
+        self._host = host
+        self._port = port or ConfigurationParser.get("common_variable", "connection_port")
+        self._password = password or ''
+        self._login_command = command
+        self._login_prompt = re_string
+
+        sock = socket.create_connection((self._host, self._port), self._connect_timeout)
+        sock.setblocking(0)
+        self.socket = sock
+        self._loop.call_soon(self._loop.add_session, sock, self)
+
+        if command is None:
+            return ''
+
+        return self.send_command(command, re_string=re_string, error_map=error_map)
+
+    def reconnect(self, re_string=''):
+        self.disconnect()
+        return self.connect(self._host, None, self._password, self._login_command, port=self._port,
+                            re_string=re_string or self._login_prompt)
+
+    def disconnect(self):
+        with self._command_lock:
+            sock = self.socket
+            self.socket = None
+
+        if sock is not None:
+            self._loop.call_soon(self._close, sock, socket.error(errno.ECONNABORTED, 'Session disconnected'))
+
+    def receive_unsolicited(self, timeout):
+        """Wait up to timeout seconds for data the device sends on its own, like TL1 autonomous messages
+
+        :return: received data, '' if nothing came
+        :raise SessionLoopLimitException: device closed the connection
+        """
+
+        deadline = time.time() + timeout
+        with self._unsolicited_condition:
+            while not self._unsolicited and self.socket is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._unsolicited_condition.wait(remaining)
+            data, self._unsolicited = self._unsolicited, ''
+
+        if not data and self.socket is None:
+            raise SessionLoopLimitException(self.__class__.__name__, 'Connection closed by device')
+        return data
+
+    def _hide_password(self, data):
+        return data.replace(self._password, "*" * 7) if self._password else data
+
+    def _execute(self, waiter, data):
+        with self._command_lock:
+            if self.socket is None:
+                raise socket.error(errno.ENOTCONN, 'Session is not connected')
+
+            self._loop.call_soon(self._begin, waiter, data)
+            waiter.done.wait()
+
+        if waiter.error is not None:
+            raise waiter.error
+
+        return waiter.result
+
+    def send_command(self, command, re_string='', error_map=None, timeout=None, **optional_args):
+        if re_string is None or len(re_string) == 0:
+            raise Exception('ExpectSession', 'List of expected messages can\'t be empty!')
+
+        timeout = timeout or command_timeouts.timeout(self._device, command, self._command_timeout)
+
+        self.logger.info('Command: {}'.format(self._hide_password(command)))
+        timer = statistics.timer('tl1.' + command_type(command)) if statistics.enabled else None
+        send_time = time.time()
+        try:
+            result_output = self._execute(_ExpectWaiter(re_string, timeout, self._match_overlap, command_ctag(command)),
+                                          command + '\r\n')
+        except SessionLoopLimitException:
+            command_timeouts.observe_timeout(self._device, command)
+            raise
+        command_timeouts.observe(self._device, command, time.time() - send_time, len(result_output))
+        if timer is not None:
+            timer.mark('socket_wait')
+
+        for error_string in error_map or dict():
+            if re.search(error_string, result_output, re.DOTALL):
+                self.logger.error(result_output)
+                raise CommandExecutionException('ExpectSession',
+                                                'Session returned \'{}\''.format(error_map[error_string]))
+
+        result_output = normalize_buffer(result_output)
+        self.logger.info(self._hide_password(result_output))
+        if timer is not None:
+            timer.mark('logging')
+            timer.finish(len(result_output))
+        return result_output
+
+    def send_pipelined(self, commands, timeout=None, **optional_args):
+        """Send TL1 commands back to back and route responses to them by CTAG
+
+        :param commands: list of (ctag, command) or (ctag, command, timeout) tuples
+        :param timeout: seconds to wait for each response, learned from previous responses of each command by default
+        :return: list of responses in the order of commands
+        """
+
+        for command_data in commands:
+            self.logger.info('Command: {}'.format(self._hide_password(command_data[1])))
+
+        waiter = _PipelineWaiter([command_data[0] for command_data in commands],
+                                 [command_data[2] if len(command_data) > 2 else
+                                  timeout or command_timeouts.timeout(self._device, command_data[1],
+                                                                      self._command_timeout)
+                                  for command_data in commands])
+        timers = [statistics.timer('tl1.' + command_type(command_data[1])) for command_data in commands] \
+            if statistics.enabled else None
+        try:
+            responses = self._execute(waiter, ''.join(command_data[1] + '\r\n' for command_data in commands))
+        finally:
+            for command_data in commands:
+                ctag = str(command_data[0])
+                if ctag in waiter.response_times:
+                    command_timeouts.observe(self._device, command_data[1],
+                                             waiter.response_times[ctag] - waiter.start_time,
+                                             len(waiter.responses[ctag]))
+                elif waiter.error is not None:
+                    command_timeouts.observe_timeout(self._device, command_data[1])
+
+        result = list()
+        for command_data in commands:
+            response = normalize_buffer(responses[str(command_data[0])])
+            self.logger.info(self._hide_password(response))
+            result.append(response)
+
+        if timers is not None:
+            for timer, response in zip(timers, result):
+                timer.finish(len(response))
+        return result
+
+    # methods below run on the event loop thread
+
+    def _begin(self, waiter, data):
+        if self.socket is None:
+            waiter.fail(socket.error(errno.ENOTCONN, 'Session is not connected'))
+            return
+
+        with self._unsolicited_condition:
+            if self._unsolicited:
+                self.logger.debug('Dropped unsolicited output: {}'.format(self._unsolicited))
+                self._unsolicited = ''
+
+        self._waiter = waiter
+        self._output += data
+
+    def on_writable(self, sock):
+        try:
+            sent = sock.send(self._output)
+        except socket.error as error:
+            if error.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._close(sock, error)
+            return
+
+        self._output = self._output[sent:]
+
+    def on_readable(self, sock):
+        try:
+            data = sock.recv(self._receive_size)
+        except socket.error as error:
+            if error.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._close(sock, error)
+            return
+
+        if not data:
+            self._close(sock, socket.error(errno.ECONNRESET, 'Connection closed by device'))
+            return
+
+        waiter = self._waiter
+        if waiter is None:
+            with self._unsolicited_condition:
+                self._unsolicited = (self._unsolicited + data)[-self._unsolicited_limit:]
+                self._unsolicited_condition.notify_all()
+            return
+
+        waiter.feed(data)
+        if waiter.done.is_set():
+            self._waiter = None
+
+    def check_deadline(self, now):
+        waiter = self._waiter
+        if waiter is not None:
+            waiter.check_deadline(now)
+            if waiter.done.is_set():
+                self._waiter = None
+
+    def _close(self, sock, error):
+        self._loop.remove_session(sock)
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
+        if sock is self.socket:
+            self.socket = None
+            with self._unsolicited_condition:
+                self._unsolicited_condition.notify_all()
+        elif self.socket is not None:
+            # socket of a previous connection
+            return
+
+        self._output = ''
+        if self._waiter is not None:
+            self._waiter.fail(error)
+            self._waiter = None
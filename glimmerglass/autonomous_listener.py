@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from glimmerglass.tl1_autonomous import AutonomousMessageReader
+
+
+class AutonomousMessageListener(object):
+    """Read TL1 autonomous messages of a chassis on a dedicated session and hand them over as they come
+
+    The full topology is retrieved again on the same session after each (re)connect, every 'resync_interval'
+    seconds and whenever a cross-connect or port message couldn't be applied, so nothing missed between messages
+    lives longer than that. Messages reporting nothing of the topology are counted and skipped.
+    """
+
+    _reconnect_delay = 10
+    # longest wait for data, bounds how long stop() takes
+    _poll_interval = 1
+
+    def __init__(self, session_factory, login, resync, on_message, on_disconnect, resync_interval=300):
+        """
+        :param session_factory: callable returning a new unconnected GGTCPSession or AsyncTL1Session
+        :param login: callable(session) connecting and authenticating the session
+        :param resync: callable(session) retrieving the full topology on the session
+        :param on_message: callable(AutonomousMessage) applying the message, returns False if it couldn't, None if
+            the message has nothing to apply
+        :param on_disconnect: callable() called when the session is lost, messages may be missed from then on
+        :param resync_interval: seconds between full resyncs
+        """
+
+        self._session_factory = session_factory
+        self._login = login
+        self._resync = resync
+        self._on_message = on_message
+        self._on_disconnect = on_disconnect
+        self._resync_interval = resync_interval or 300
+
+        self._stopped = threading.Event()
+        self._thread = None
+        self.connected = False
+
+        self.messages_count = 0
+        self.unapplied_count = 0
+        self.ignored_count = 0
+        self.resync_count = 0
+        self.reconnect_count = 0
+        self.last_resync = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='AutonomousMessageListener')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            session = None
+            try:
+                session = self._session_factory()
+                self._login(session)
+                self._listen(session)
+            except Exception:
+                logging.getLogger(__name__).warning('Autonomous message session failed', exc_info=True)
+            finally:
+                self.connected = False
+                self._on_disconnect()
+                if session is not None:
+                    try:
+                        session.disconnect()
+                    except Exception:
+                        pass
+
+            self.reconnect_count += 1
+            self._stopped.wait(self._reconnect_delay)
+
+    def _do_resync(self, session):
+        self._resync(session)
+        self.resync_count += 1
+        self.last_resync = time.time()
+
+    def _listen(self, session):
+        reader = AutonomousMessageReader()
+        self._do_resync(session)
+        self.connected = True
+
+        while not self._stopped.is_set():
+            timeout = min(self.last_resync + self._resync_interval - time.time(), self._poll_interval)
+            data = session.receive_unsolicited(max(timeout, 0))
+
+            resync_needed = False
+            for message in reader.feed(data) if data else list():
+                self.messages_count += 1
+                applied = self._on_message(message)
+                if applied is None:
+                    self.ignored_count += 1
+                elif not applied:
+                    self.unapplied_count += 1
+                    resync_needed = True
+
+            if resync_needed or time.time() >= self.last_resync + self._resync_interval:
+                self._do_resync(session)
+
+    def get_statistics(self):
+        return {
+            'connected': self.connected,
+            'messages': self.messages_count,
+            'unapplied': self.unapplied_count,
+            'ignored': self.ignored_count,
+            'resyncs': self.resync_count,
+            'reconnects': self.reconnect_count,
+            'since_resync': time.time() - self.last_resync if self.last_resync else None
+        }
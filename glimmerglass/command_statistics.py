@@ -0,0 +1,163 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from glimmerglass.file_helper import write_file_atomically
+
+
+def percentile(samples, value):
+    """Sample below which 'value' (0..1) of the samples fall, 0 without samples"""
+
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * value), len(samples) - 1)] if samples else 0
+
+
+def run_periodically(function, interval, name):
+    """Call function every 'interval' seconds on a daemon thread, failures are logged
+
+    :return: the started thread
+    """
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                function()
+            except Exception:
+                logging.getLogger(__name__).warning('{0} failed'.format(name), exc_info=True)
+
+    thread = threading.Thread(target=loop, name=name)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+class _Histogram(object):
+    def __init__(self, max_samples):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.total_time = 0.0
+        self.received_bytes = 0
+
+    def add(self, duration, received_bytes):
+        self.samples.append(duration)
+        self.count += 1
+        self.total_time += duration
+        self.received_bytes += received_bytes
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total_time,
+            'p50': percentile(self.samples, 0.50),
+            'p95': percentile(self.samples, 0.95),
+            'p99': percentile(self.samples, 0.99),
+            'bytes': self.received_bytes
+        }
+
+
+class CommandTimer(object):
+    """Duration of one command split into phases, each mark() closes the phase started by the previous one"""
+
+    def __init__(self, collector, name):
+        self._collector = collector
+        self.name = name
+        self.start_time = self._phase_start = time.time()
+        self.phases = dict()
+
+    def mark(self, phase):
+        now = time.time()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._phase_start
+        self._phase_start = now
+
+    def finish(self, received_bytes=0):
+        self._collector.record(self.name, time.time() - self.start_time, received_bytes)
+        for phase, duration in self.phases.iteritems():
+            self._collector.record('{0}.{1}'.format(self.name, phase), duration)
+
+
+class CommandStatistics(object):
+    """Latency histograms per command type, kept over the last 'max_samples' calls
+
+    Hooks check 'enabled' before taking any timestamps, so a disabled collector costs an attribute lookup.
+    """
+
+    def __init__(self, max_samples=1024):
+        self.enabled = False
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+        self._histograms = dict()
+        self._dump_thread = None
+
+    def configure(self, enabled=False, dump_interval=0, dump_folder=None, max_samples=None):
+        """
+        :param enabled: collect statistics
+        :param dump_interval: seconds between statistics dumps, 0 disables dumps
+        :param dump_folder: folder for glimmerglass_statistics.json
+        """
+
+        self._max_samples = max_samples or self._max_samples
+        self.enabled = enabled
+        if enabled and dump_interval and dump_folder and self._dump_thread is None:
+            self._dump_thread = run_periodically(lambda: self.dump(dump_folder), dump_interval,
+                                                 'CommandStatisticsDump')
+
+    def record(self, name, duration, received_bytes=0):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram(self._max_samples)
+            histogram.add(duration, received_bytes)
+
+    def timer(self, name):
+        """CommandTimer for 'name', None when collection is disabled"""
+
+        return CommandTimer(self, name) if self.enabled else None
+
+    def timed(self, name):
+        """Decorator recording the duration of each call under 'name'"""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+
+                start_time = time.time()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, time.time() - start_time)
+
+            return wrapper
+
+        return decorator
+
+    def get_statistics(self):
+        with self._lock:
+            return dict((name, histogram.summary()) for name, histogram in self._histograms.iteritems())
+
+    def reset(self):
+        with self._lock:
+            self._histograms = dict()
+
+    def dump(self, folder):
+        content = {'time': time.time(), 'commands': self.get_statistics()}
+        write_file_atomically(os.path.join(folder, 'glimmerglass_statistics.json'),
+                              lambda statistics_file: json.dump(content, statistics_file, indent=2, sort_keys=True))
+
+
+def command_type(command):
+    """TL1 verb of a command, 'rtrv-crs-fiber::all:5;' -> 'rtrv-crs-fiber'"""
+
+    return command.split(':', 1)[0].strip().lower()
+
+
+statistics = CommandStatistics()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from common.driver_handler_base import DriverHandlerBase
+from common.configuration_parser import ConfigurationParser
+from glimmerglass.glimmerglass_driver_handler import GlimmerglassDriverHandler
+from glimmerglass.request_dispatcher import RequestDispatcher
+from glimmerglass.session_pool import SessionPool
+
+
+class DispatchingDriverHandler(DriverHandlerBase):
+    """Driver handler keeping a GlimmerglassDriverHandler per chassis address
+
+    Requests run on the RequestDispatcher worker pool, serialized per chassis, so a slow request to one chassis
+    doesn't hold requests to the others. Requests for an address without a login fail.
+    """
+
+    def __init__(self):
+        DriverHandlerBase.__init__(self)
+
+        dispatcher_settings = ConfigurationParser.get("driver_variable", "request_dispatcher") or dict()
+        self._dispatcher = RequestDispatcher(**dispatcher_settings)
+
+        self._lock = threading.Lock()
+        self._handlers = dict()
+
+    @staticmethod
+    def _device_address(address):
+        return str(address).split('/')[0]
+
+    def _get_handler(self, address, create=False):
+        with self._lock:
+            handler = self._handlers.get(address)
+            if handler is None and not create:
+                # port addresses may come without the TCP port of the login address
+                for handler_address in self._handlers:
+                    if handler_address.split(':')[0] == address.split(':')[0]:
+                        address = handler_address
+                        handler = self._handlers[address]
+                        break
+            if handler is None and not create:
+                raise Exception(self.__class__.__name__, "No login for address {0}".format(address))
+
+            if handler is None:
+                handler = self._handlers[address] = GlimmerglassDriverHandler()
+
+        return address, handler
+
+    def _dispatch(self, address, method_name, *args, **kwargs):
+        address, handler = self._get_handler(self._device_address(address), create=method_name == 'login')
+        return self._dispatcher.call(address, method_name, getattr(handler, method_name), *args, **kwargs)
+
+    def login(self, address, username, password, command_logger=None):
+        return self._dispatch(address, 'login', address, username, password, command_logger)
+
+    def get_resource_description(self, address, command_logger=None, force_refresh=False):
+        return self._dispatch(address, 'get_resource_description', address, command_logger, force_refresh)
+
+    def _dispatch_map(self, method_name, src_port, dst_port, command_logger):
+        """Run a map request, merged with the map requests queued right behind it for the chassis"""
+
+        address, handler = self._get_handler(self._device_address(src_port[0]))
+        return self._dispatcher.call_batched(address, method_name, handler.map_batch,
+                                             (method_name, src_port, dst_port, command_logger))
+
+    def map_uni(self, src_port, dst_port, command_logger=None):
+        return self._dispatch_map('map_uni', src_port, dst_port, command_logger)
+
+    def map_bidi(self, src_port, dst_port, command_logger=None):
+        return self._dispatch_map('map_bidi', src_port, dst_port, command_logger)
+
+    def map_clear_to(self, src_port, dst_port, command_logger=None):
+        return self._dispatch_map('map_clear_to', src_port, dst_port, command_logger)
+
+    def map_clear(self, src_port, dst_port, command_logger=None):
+        return self._dispatch_map('map_clear', src_port, dst_port, command_logger)
+
+    def apply_route_set(self, routes, clear_ports=(), exclusive=False, command_logger=None):
+        """Apply the route set on each chassis it names, see GlimmerglassDriverHandler.apply_route_set"""
+
+        routes_by_address = dict()
+        clear_ports_by_address = dict()
+        for route in routes:
+            routes_by_address.setdefault(self._device_address(route[0][0]), list()).append(route)
+        for port in clear_ports:
+            clear_ports_by_address.setdefault(self._device_address(port[0]), list()).append(port)
+
+        result = {'disconnected': 0, 'connected': 0, 'unchanged': 0}
+        for address in sorted(set(routes_by_address) | set(clear_ports_by_address)):
+            address_result = self._dispatch(address, 'apply_route_set', routes_by_address.get(address, list()),
+                                            clear_ports_by_address.get(address, list()), exclusive, command_logger)
+            for name in result:
+                result[name] += address_result[name]
+        return result
+
+    def set_speed_manual(self, command_logger=None):
+        with self._lock:
+            addresses = sorted(self._handlers)
+        for address in addresses:
+            self._dispatch(address, 'set_speed_manual', command_logger)
+
+    def get_dispatcher_statistics(self):
+        return self._dispatcher.get_statistics()
+
+    def get_cache_statistics(self):
+        """Topology cache statistics of each chassis address"""
+
+        with self._lock:
+            handlers = self._handlers.values()
+        cache_statistics = dict()
+        for handler in handlers:
+            cache_statistics.update(handler.get_cache_statistics())
+        return cache_statistics
+
+    def get_session_pool_statistics(self):
+        session_pool_settings = ConfigurationParser.get("driver_variable", "session_pool") or dict()
+        return SessionPool.shared(**session_pool_settings).get_statistics()
@@ -0,0 +1,34 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import ctypes
+import os
+
+_MOVEFILE_REPLACE_EXISTING = 0x1
+_MOVEFILE_WRITE_THROUGH = 0x8
+
+
+def replace_file(source_path, file_path):
+    """Move source_path over file_path in one step, file_path holds either its old or its new content at any time"""
+
+    if os.name == 'nt':
+        # os.rename doesn't replace an existing file on Windows
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(source_path), unicode(file_path),
+                                                  _MOVEFILE_REPLACE_EXISTING | _MOVEFILE_WRITE_THROUGH):
+            raise ctypes.WinError()
+    else:
+        os.rename(source_path, file_path)
+
+
+def write_file_atomically(file_path, write):
+    """Write a file through a temporary one replacing it once complete, so a crash never leaves a partial file
+
+    :param write: callable(file) writing the content
+    """
+
+    temp_file_path = file_path + '.tmp'
+    with open(temp_file_path, 'w') as temp_file:
+        write(temp_file)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    replace_file(temp_file_path, file_path)
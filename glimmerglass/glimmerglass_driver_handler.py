@@ -1,12 +1,30 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import logging
 import re
+import threading
+import time
+from array import array
+from collections import namedtuple
 
 from common.driver_handler_base import DriverHandlerBase
 from common.resource_info import ResourceInfo
 from common.configuration_parser import ConfigurationParser
+from glimmerglass import tl1_autonomous, tl1_parser
+from glimmerglass.async_tcp_session import AsyncTL1Session
+from glimmerglass.autonomous_listener import AutonomousMessageListener
+from glimmerglass.command_statistics import statistics
+from glimmerglass.map_batcher import CrossConnectBatcher, MapRequest
+from glimmerglass.resource_description import ResourceDescriptionWriter
+from glimmerglass.session_pool import SessionPool
 from glimmerglass.tcp_session import GGTCPSession
+from glimmerglass.topology import DeviceTopology, IN, IN_PORT_BASE, OUT_PORT_BASE
+from glimmerglass.topology_cache import TopologyCache
+from glimmerglass.topology_snapshot import snapshots
+
+# map request to the batcher, update(topology) applying it to the cached topology, (IN AID, OUT AID) to verify
+_MapPlan = namedtuple('_MapPlan', ['request', 'update', 'connections', 'log'])
 
 
 class GlimmerglassDriverHandler(DriverHandlerBase):
@@ -14,23 +32,110 @@ class GlimmerglassDriverHandler(DriverHandlerBase):
         DriverHandlerBase.__init__(self)
 
         self._ctag = 1
+        self._ctag_lock = threading.Lock()
         self._switch_name = ''
-        self._switch_size = 0
-        self._mapping_info = dict()
-
         self._resource_info = None
 
         self._service_mode = ConfigurationParser.get("driver_variable", "service_mode")
         self._port_logical_mode = ConfigurationParser.get("driver_variable", "port_mode")
         self._custom_port_pairing = ConfigurationParser.get("driver_variable", "custom_port_pairing") or dict()
+        self._custom_port_pairing_reverse = dict()
+        for key, value in self._custom_port_pairing.iteritems():
+            self._custom_port_pairing_reverse.setdefault(value, list()).append(key)
         self._login_prompt = ConfigurationParser.get("common_variable", "device_login_prompt")
         self._prompt = ConfigurationParser.get("common_variable", "device_prompt")
-        self._session = GGTCPSession()
+        self._session = None
+        self._session_key = None
+        if ConfigurationParser.get("common_variable", "connection_type") == "tcp_async":
+            self._session_class = AsyncTL1Session
+        else:
+            self._session_class = GGTCPSession
+
+        session_pool_settings = ConfigurationParser.get("driver_variable", "session_pool") or dict()
+        self._session_pool = SessionPool.shared(**session_pool_settings)
+
+        self._pipeline_commands = ConfigurationParser.get("driver_variable", "pipeline_commands") or False
+
+        self._verify_map = ConfigurationParser.get("driver_variable", "verify_map") or False
+        self._stream_resource_description = ConfigurationParser.get("driver_variable",
+                                                                    "stream_resource_description") or False
+        # ((address, system info), prepared ResourceDescriptionWriter or None if ResourceInfo can't be templated)
+        self._resource_description_writer = None
+
+        self._topology_cache = TopologyCache(ConfigurationParser.get("driver_variable", "topology_cache_ttl"))
+        self._listener_settings = ConfigurationParser.get("driver_variable", "autonomous_listener") or dict()
+        discovery_settings = ConfigurationParser.get("driver_variable", "parallel_discovery") or dict()
+        self._discovery_sessions_count = discovery_settings.get("sessions") or 0
+        self._login_credentials = None
+        self._listener = None
+        # merges the cross-connects of apply_route_set and of map requests queued together, see map_batch()
+        self._map_batcher = CrossConnectBatcher(
+            send_command=lambda command: self._get_session().send_command(command, re_string=self._prompt),
+            next_ctag=self._incr_ctag,
+            window=ConfigurationParser.get("driver_variable", "map_batch_window"),
+            max_ports=ConfigurationParser.get("driver_variable", "map_batch_max_ports"),
+            send_commands=((lambda commands: self._get_session().send_pipelined(commands))
+                           if self._pipeline_commands else None),
+            refresh_ports=self.refresh_ports)
 
     def _incr_ctag(self):
-        self._ctag += 1
-        return self._ctag
+        with self._ctag_lock:
+            self._ctag += 1
+            return self._ctag
+
+    def _open_session(self, session, ip, port, username, password, command_logger=None):
+        command = 'ACT-USER::{0}:{1}::{2};'.format(username, self._ctag, password)
+        command_result = session.connect(host=ip, username=username, password=password, command=command,
+                                         re_string=self._login_prompt, port=port)
+        if command_logger is not None:
+            command_logger.info(command_result)
 
+        if not re.search(r'COMPLD', command_result):
+            if command_logger is not None:
+                command_logger.info('Didn\'t find success message, retrying ...')
+            command_result = session.send_command(command, re_string=self._login_prompt)
+            if command_logger is not None:
+                command_logger.info(command_result)
+        elif command_logger is not None:
+            command_logger.info('Login status: OK')
+
+        return command_result
+
+    def _keepalive(self, session):
+        return session.send_command("rtrv-hdr:::{0};".format(self._incr_ctag()), re_string=self._prompt)
+
+    def _open_pooled_session(self, session, ip, port, username, password):
+        """Log in a session for the pool, fail if the device denies it, so a denied session is never pooled"""
+
+        command_result = self._open_session(session, ip, port, username, password)
+        if not re.search(r'COMPLD', command_result):
+            try:
+                session.disconnect()
+            except Exception:
+                pass
+            raise Exception(self.__class__.__name__, "Login denied: {0}".format(command_result))
+        return command_result
+
+    def _get_pooled_session(self, ip, port, username, password):
+        """
+        :return: (PooledSession, reused)
+        """
+
+        # the pool keeps the login for relogins and reconnects, it must not hold the logger of one request
+        return self._session_pool.get(
+            key=(ip, port, username, password),
+            session_factory=self._session_class,
+            login=lambda session: self._open_pooled_session(session, ip, port, username, password),
+            keepalive=self._keepalive)
+
+    def _get_session(self):
+        """Session of the last login, taken from the pool again if the pool closed it meanwhile"""
+
+        if self._session is not None and not self._session.is_connected():
+            self._session, _ = self._get_pooled_session(*self._login_credentials)
+        return self._session
+
+    @statistics.timed('driver.login')
     def login(self, address, username, password, command_logger=None):
         ip = address
         port = None
@@ -39,264 +144,705 @@ class GlimmerglassDriverHandler(DriverHandlerBase):
             ip = address_data[0]
             port = int(address_data[1])
         if self._service_mode.lower() == u"tl1":
-            command = 'ACT-USER::{0}:{1}::{2};'.format(username, self._ctag, password)
-            command_result = self._session.connect(host=ip, username=username, password=password, command=command,
-                                                   re_string=self._login_prompt, port=port)
-            command_logger.info(command_result)
-
-            if not re.search(r'COMPLD', command_result):
-                command_logger.info('Didn\'t find success message, retrying ...')
-                command_result = self._session.send_command(command, re_string=self._login_prompt)
-                command_logger.info(command_result)
-            else:
-                command_logger.info('Login status: OK')
-
-            match_result = re.search(r"<\s+(?P<host>\S+)\s+\d+", command_result, re.DOTALL)
+            self._session, reused = self._get_pooled_session(ip, port, username, password)
+
+            if command_logger is not None:
+                if reused:
+                    command_logger.info('Login status: OK, reusing authenticated session')
+                else:
+                    command_logger.info(self._session.login_output)
+
+            self._login_credentials = (ip, port, username, password)
+            if self._session.key != self._session_key:
+                self._session_key = self._session.key
+                self._topology_cache.invalidate()
+                self._load_snapshot(ip, port, username, password, command_logger)
+                self._start_listener(ip, port, username, password)
+
+            match_result = re.search(r"<\s+(?P<host>\S+)\s+\d+", self._session.login_output, re.DOTALL)
             if match_result is not None:
                 self._switch_name = match_result.groupdict()['host']
         else:
             raise Exception(self.__class__.__name__,
                             "Selected '{}' connection type is not supported".format(self._service_mode))
 
-    def _get_device_data(self):
+    def _load_snapshot(self, ip, port, username, password, command_logger=None):
+        """Serve the saved topology of the device as stale until it is retrieved again, save it on every change"""
+
+        snapshot_key = ip if port is None else '{0}_{1}'.format(ip, port)
+        self._topology_cache.on_change = lambda topology: snapshots.save(snapshot_key, topology)
+
+        topology, saved_time = snapshots.load(snapshot_key)
+        if topology is None:
+            return
+
+        self._topology_cache.put(topology, stale=True, timestamp=saved_time)
+        if command_logger is not None:
+            command_logger.info('Serving topology snapshot saved at {0} until it is retrieved from the device'.format(
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(saved_time))))
+
+        # an autonomous message listener retrieves the topology as soon as it connects
+        if not self._listener_settings.get("enabled"):
+            refresh_thread = threading.Thread(target=self._refresh_stale_topology,
+                                              args=(ip, port, username, password), name='TopologyRefresh')
+            refresh_thread.daemon = True
+            refresh_thread.start()
+
+    def _refresh_stale_topology(self, ip, port, username, password):
+        """Retrieve the topology on a session of its own and replace the stale one, unless a request did it first"""
+
+        session = self._session_class()
+        try:
+            self._open_session(session, ip, port, username, password)
+            for _ in range(3):
+                generation = self._topology_cache.generation
+                topology = self._parse_topology(self._get_device_data(session))
+                with self._topology_cache.lock:
+                    if not self._topology_cache.stale:
+                        break
+                    # a map made while retrieving may be missing from the topology, retrieve it again
+                    if self._topology_cache.generation == generation:
+                        self._topology_cache.put(topology)
+                        break
+        except Exception:
+            logging.getLogger(__name__).warning('Failed to refresh stale topology', exc_info=True)
+        finally:
+            with self._topology_cache.lock:
+                if self._topology_cache.stale:
+                    self._topology_cache.invalidate()
+            try:
+                session.disconnect()
+            except Exception:
+                pass
+
+    def _start_listener(self, ip, port, username, password):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            self._topology_cache.set_live(False)
+
+        if not self._listener_settings.get("enabled"):
+            return
+
+        self._listener = AutonomousMessageListener(
+            session_factory=self._session_class,
+            login=lambda session: self._open_session(session, ip, port, username, password),
+            resync=self._resync_topology,
+            on_message=self._apply_autonomous_message,
+            on_disconnect=lambda: self._topology_cache.set_live(False),
+            resync_interval=self._listener_settings.get("resync_interval"))
+        self._listener.start()
+
+    def _resync_topology(self, session):
+        """Retrieve full topology on the listener session and serve it from the cache until the session is lost"""
+
+        device_data = self._get_device_data(session)
+        topology = self._parse_topology(device_data)
+
+        # messages received while retrieving the topology precede some of the responses, apply them in order
+        reader = tl1_autonomous.AutonomousMessageReader()
+        for key in ("system_info", "port_list", "connections_map"):
+            for message in reader.feed(device_data[key]):
+                tl1_autonomous.apply_message(topology, message)
+
+        self._topology_cache.put(topology)
+        self._topology_cache.set_live(True)
+
+    def _apply_autonomous_message(self, message):
+        with self._topology_cache.lock:
+            topology = self._topology_cache.topology
+            if topology is None:
+                # next request retrieves the whole topology anyway
+                return None
+
+            applied = tl1_autonomous.apply_message(topology, message)
+            if applied:
+                self._topology_cache.touch()
+            return applied
+
+    def get_listener_statistics(self):
+        return self._listener.get_statistics() if self._listener is not None else None
+
+    def get_session_pool_statistics(self):
+        return self._session_pool.get_statistics()
+
+    def get_dispatcher_statistics(self):
+        # requests run on the thread of the caller, there is no dispatcher
+        return None
+
+    def _send_commands(self, session, commands):
+        """Send (key, command with '{0}' for ctag) commands, pipelined if enabled
+
+        :return: dict key -> response
+        """
+
+        if self._pipeline_commands:
+            ctag_list = [self._incr_ctag() for _ in commands]
+            responses = session.send_pipelined([(ctag, command.format(ctag))
+                                                for ctag, (_, command) in zip(ctag_list, commands)])
+            return dict(zip([key for key, _ in commands], responses))
+
+        return dict((key, session.send_command(command.format(self._incr_ctag()), re_string=self._prompt))
+                    for key, command in commands)
+
+    def _get_device_data(self, session=None):
+        session = session or self._get_session()
         device_data = dict()
 
         if self._service_mode.lower() == u"scpi":
             pass
         elif self._service_mode.lower() == u"tl1":
-            command = "rtrv-system-info:::{0};".format(self._incr_ctag())
-            device_data["system_info"] = self._session.send_command(command, re_string=self._prompt)
-
-            size_match = re.search(r"LicensedPortMatrix=(?P<src>\d+)x(?P<dst>\d+)", device_data["system_info"],
-                                   re.DOTALL)
+            device_data = self._send_commands(session, [("system_info", "rtrv-system-info:::{0};"),
+                                                        ("port_list", "RTRV-CFG-FIBER::all:{0};"),
+                                                        ("connections_map", "rtrv-crs-fiber::all:{0};")])
 
-            if size_match is not None:
-                size_dict = size_match.groupdict()
+            switch_size = tl1_parser.parse_switch_size(device_data["system_info"])
 
-                self._switch_size = int(size_dict["src"]) + int(size_dict["dst"])
+            if switch_size is not None:
+                device_data["switch_size"] = sum(switch_size)
             else:
                 raise Exception(self.__class__.__name__, "Can't find 'size' parameter!")
-
-            command = "RTRV-CFG-FIBER::all:{0};".format(self._incr_ctag())
-            device_data["port_list"] = self._session.send_command(command, re_string=self._prompt)
-
-            command = "rtrv-crs-fiber::all:{0};".format(self._incr_ctag())
-            device_data["connections_map"] = self._session.send_command(command, re_string=self._prompt)
         else:
             raise Exception(self.__class__.__name__,
                             "Selected '{}' connection type is not supported".format(self._service_mode))
 
         return device_data
 
-    def get_resource_description(self, address, command_logger=None):
-        device_data = self._get_device_data()
-
-        self._resource_info = ResourceInfo()
-        self._resource_info.set_depth(0)
-        self._resource_info.set_index(1)
+    def _build_logical_port_map(self, topology):
+        """OUT port number paired with each logical port number and the state of each logical port
+
+        :return: (array of OUT port numbers, 0 where the port has no address, array of 1 for enabled ports)
+        """
+
+        size = len(topology.in_aid)
+        paired_out = array('i', [0]) * size
+        port_state = array('b', [0]) * size
+        seen = array('b', [0]) * size
+        for aid in topology.port_aids:
+            direction, number = topology.port(aid)
+            seen[number] = 1
+            # a logical port takes the state of the last one of its IN/OUT ports in device order
+            port_state[number] = topology.is_good(aid)
+
+            if direction == IN:
+                continue
+            if str(number) in self._custom_port_pairing_reverse:
+                for key in self._custom_port_pairing_reverse[str(number)]:
+                    if int(key) < size and seen[int(key)]:
+                        paired_out[int(key)] = number
+            else:
+                paired_out[number] = number
 
-        self._resource_info.set_address(address)
+        for number in range(size):
+            if not topology.in_aid[number]:
+                paired_out[number] = 0
 
-        if self._service_mode.lower() == "tl1":
-            model_info_match = re.search('SerialNumber=(?P<serial>\S+)".*SystemType=(?P<type>\S+)".*"(?P<vendor>\S+):' +
-                                         'ChassisType=(?P<model>\S+)".*SoftwareActiveVersion=(?P<version>\S+)"',
-                                         device_data["system_info"], re.DOTALL)
+        return paired_out, port_state
 
-            # add chassis info
-            if model_info_match is not None:
-                model_info_dict = model_info_match.groupdict()
+    def _parse_topology(self, device_data):
+        if self._port_logical_mode.lower() == "logical":
+            connections = tl1_parser.parse_connections(device_data["connections_map"])
+        else:
+            connections = tl1_parser.parse_connections(device_data["connections_map"], allow_unnamed_ports=True)
+
+        return DeviceTopology(system_info=tl1_parser.parse_system_info(device_data["system_info"]),
+                              switch_size=device_data["switch_size"],
+                              ports=tl1_parser.parse_ports(device_data["port_list"]),
+                              connections=connections)
+
+    def _get_discovery_session(self, index):
+        """Extra pooled session to the device, the main session if it can't be opened"""
+
+        ip, port, username, password = self._login_credentials
+        try:
+            session, _ = self._session_pool.get(
+                key=self._session.key + ('discovery', index),
+                session_factory=self._session_class,
+                login=lambda session: self._open_pooled_session(session, ip, port, username, password),
+                keepalive=self._keepalive)
+        except Exception:
+            logging.getLogger(__name__).warning('Failed to open discovery session', exc_info=True)
+            return self._get_session()
+        return session
+
+    @statistics.timed('driver.discover_topology')
+    def _discover_topology(self):
+        """Retrieve system info, ports and cross-connects at once on separate sessions
+
+        Extra sessions are opened, or taken from the pool, by the threads using them and each response is parsed by
+        the thread which received it, so the topology is ready soon after the slowest retrieval. Retrievals share
+        sessions in turn above 'parallel_discovery.sessions' and fall back to the main session if an extra one can't
+        be opened.
+        """
+
+        allow_unnamed_ports = self._port_logical_mode.lower() != "logical"
+        retrievals = [("system_info", "rtrv-system-info:::{0};", tl1_parser.parse_system_info),
+                      ("port_list", "RTRV-CFG-FIBER::all:{0};", tl1_parser.parse_ports),
+                      ("connections_map", "rtrv-crs-fiber::all:{0};",
+                       lambda response: tl1_parser.parse_connections(response, allow_unnamed_ports))]
+        results = dict()
+        errors = list()
+
+        def retrieve(session_index, key, command, parse):
+            try:
+                session = self._get_discovery_session(session_index - 1) if session_index else self._get_session()
+                response = self._send_commands(session, [(key, command)])[key]
+                if not re.search(r'COMPLD', response):
+                    raise Exception(self.__class__.__name__, "'{0}' failed: {1}".format(command.split(':')[0],
+                                                                                        response))
+                results[key] = parse(response)
+                if key == "system_info":
+                    results["switch_size"] = tl1_parser.parse_switch_size(response)
+            except Exception as error:
+                errors.append(error)
+
+        threads = list()
+        for index, (key, command, parse) in enumerate(retrievals):
+            thread = threading.Thread(target=retrieve,
+                                      args=(index % (self._discovery_sessions_count + 1), key, command, parse),
+                                      name='TopologyDiscovery-{0}'.format(key))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        if results["switch_size"] is None:
+            raise Exception(self.__class__.__name__, "Can't find 'size' parameter!")
+        return DeviceTopology(system_info=results["system_info"],
+                              switch_size=sum(results["switch_size"]),
+                              ports=results["port_list"],
+                              connections=results["connections_map"])
+
+    def _get_topology(self, force_refresh=False):
+        topology = None if force_refresh else self._topology_cache.get()
+        if topology is None:
+            if self._discovery_sessions_count and self._service_mode.lower() == "tl1":
+                topology = self._discover_topology()
+            else:
+                topology = self._parse_topology(self._get_device_data())
+            self._topology_cache.put(topology)
 
-                self._resource_info.add_attribute("Vendor", model_info_dict["vendor"])
-                self._resource_info.add_attribute("Type", model_info_dict["type"])
-                self._resource_info.add_attribute("Version", model_info_dict["version"])
-                self._resource_info.add_attribute("Model", model_info_dict["model"])
+        return topology
 
-                model_name = model_info_dict["model"]
+    def _update_topology(self, completed, update):
+        """Write-through a map command result to the cached topology, drop the cache if command failed"""
 
-                self._resource_info.set_model_name(model_info_dict["model"])
-                self._resource_info.set_serial_number(model_info_dict["serial"])
-            else:
-                raise Exception(self.__class__.__name__, "Can't parse model info!")
+        with self._topology_cache.lock:
+            topology = self._topology_cache.topology
+            if topology is None:
+                return
 
-            # get port mappings and port info
-            address_prefix = address + "/"
-            port_map_list = device_data["connections_map"].split("\n")
-            port_list = device_data['port_list'].split("\n")
-
-            if self._port_logical_mode.lower() == "logical":
-                logical_port_map = dict()
-                for port_data in port_list:
-                    port_info_match = re.search(r"PORTID=(?P<id>\d+).*PORTNAME=(?P<name>(IN|OUT)\d+)" +
-                                                ".*PORTHEALTH=(?P<state>good|bad)", port_data, re.DOTALL)
-                    if port_info_match is not None:
-                        port_info_dict = port_info_match.groupdict()
-                        logical_port_id = re.sub('(IN|OUT)', '', port_info_dict["name"])
-                        if logical_port_id not in logical_port_map.keys():
-                            logical_port_map[logical_port_id] = {}
-                        if port_info_dict["state"].lower() == "good":
-                            port_state = "Enable"
-                        else:
-                            port_state = "Disable"
-
-                        logical_port_map[logical_port_id]['state'] = port_state
-
-                        if 'in' in port_info_dict["name"].lower():
-                            logical_port_map[logical_port_id]['in'] = logical_port_id
-                        else:
-                            if logical_port_id in self._custom_port_pairing.values():
-                                for key, value in self._custom_port_pairing.iteritems():
-                                    if value == logical_port_id and key in logical_port_map:
-                                        logical_port_map[key]['out'] = logical_port_id
-                            else:
-                                logical_port_map[logical_port_id]['out'] = logical_port_id
-
-                for port_id, port_data in logical_port_map.iteritems():
-                    if 'in' in port_data and 'out' in port_data:
-                        logical_port_map[port_id]['port_address'] = '{0}-{1}'.format(
-                            logical_port_map[port_id]['in'],
-                            logical_port_map[port_id]['out'])
-
-                for port_data in port_map_list:
-                    port_map_match = re.search(r"IPORTID=(?P<src_port>\d+).*IPORTNAME=(?P<src_port_name>\S+),IP.*" +
-                                               "OPORTID=(?P<dst_port>\d+).*OPORTNAME=(?P<dst_port_name>\S+),OP.*",
-                                               port_data, re.DOTALL)
-                    if port_map_match is not None:
-                        port_map_dict = port_map_match.groupdict()
-                        src_logical_port_id = re.sub('(IN|OUT)', '', port_map_dict["src_port_name"])
-                        dst_logical_port_id = re.sub('(IN|OUT)', '', port_map_dict["dst_port_name"])
-                        if src_logical_port_id in logical_port_map.keys() \
-                                and dst_logical_port_id in logical_port_map.keys():
-                            self._mapping_info[dst_logical_port_id] = src_logical_port_id
-
-                for logical_port_index, logical_port_data in logical_port_map.iteritems():
-                    port_resource_info = ResourceInfo()
-                    port_resource_info.set_depth(1)
-                    if 'port_address' not in logical_port_data:
-                        continue
-                    port_resource_info.set_index(logical_port_data['port_address'])
-                    port_resource_info.set_model_name(model_name)
-                    if logical_port_index in self._mapping_info:
-                        port_resource_info.set_mapping(address_prefix +
-                                                       logical_port_map[self._mapping_info[logical_port_index]][
-                                                           'port_address'])
-                    port_resource_info.add_attribute("State", logical_port_data['state'])
-                    port_resource_info.add_attribute("Protocol Type", 0)
-                    self._resource_info.add_child(logical_port_data['port_address'], port_resource_info)
+            if completed:
+                update(topology)
+                self._topology_cache.touch()
             else:
-                for port_data in port_map_list:
-                    port_map_match = re.search(r".*IPORTID=(?P<src_port>\d+).*IPORTNAME=(?P<src_port_name>\S*),IP.*" +
-                                               "OPORTID=(?P<dst_port>\d+).*OPORTNAME=(?P<dst_port_name>\S*),OP.*",
-                                               port_data, re.DOTALL)
-
-                    if port_map_match is not None:
-                        port_map_dict = port_map_match.groupdict()
-                        if int(port_map_dict['src_port']) > 0 and \
-                                int(port_map_dict['dst_port']) > 0:
-                            src_port = port_map_dict["src_port"]
-                            dst_port = port_map_dict["dst_port"]
-                            # self._mapping_info[dst_port] = src_port
-                            self._mapping_info[src_port] = dst_port
-
-                for port_data in port_list:
-                    port_info_match = re.search(r"PORTID=(?P<id>\d+).*PORTNAME=(?P<name>(IN|OUT)\d+)" +
-                                                ".*PORTHEALTH=(?P<state>good|bad)", port_data, re.DOTALL)
-
-                    if port_info_match is not None:
-                        port_info_dict = port_info_match.groupdict()
-
-                        port_resource_info = ResourceInfo()
-                        port_resource_info.set_depth(1)
-
-                        port_id = port_info_dict["id"]
-                        port_resource_info.set_index(port_id)
-                        port_resource_info.set_model_name(model_name)
-                        # port_resource_info.set_name(port_info_dict["name"])
-
-                        if port_id in self._mapping_info:
-                            port_resource_info.set_mapping(address_prefix + self._mapping_info[port_id])
-
-                        if port_info_dict["state"].lower() == "good":
-                            port_resource_info.add_attribute("State", "Enable")
-                        else:
-                            port_resource_info.add_attribute("State", "Disable")
-
-                        port_resource_info.add_attribute("Protocol Type", 0)
-
-                        self._resource_info.add_child(port_info_dict["id"], port_resource_info)
+                self._topology_cache.invalidate()
+
+    def refresh_ports(self, aids):
+        """Retrieve state and cross-connects of the AIDs only and merge them into the cached topology
+
+        Without a cached topology, or if the device reports ports the topology doesn't know, the full topology is
+        retrieved instead.
+
+        :param aids: port AIDs, both IN and OUT AID of a logical port if both are needed
+        :return: DeviceTopology
+        """
+
+        if self._topology_cache.topology is None or self._service_mode.lower() != "tl1":
+            return self._get_topology()
+
+        aid_list = tl1_parser.format_aids(aids)
+        port_data = self._send_commands(self._get_session(),
+                                        [("port_list", "RTRV-CFG-FIBER::" + aid_list + ":{0};"),
+                                         ("connections_map", "rtrv-crs-fiber::" + aid_list + ":{0};")])
+        connections = tl1_parser.parse_connections(port_data["connections_map"],
+                                                   allow_unnamed_ports=self._port_logical_mode.lower() != "logical")
+
+        with self._topology_cache.lock:
+            topology = self._topology_cache.topology
+            if topology is not None and topology.merge(tl1_parser.parse_ports(port_data["port_list"]), connections,
+                                                       aids):
+                self._topology_cache.touch()
+                return topology
+        return self._get_topology(force_refresh=True)
+
+    def _verify_connections(self, connections):
+        """Check the device has the (IN AID, OUT AID) cross-connects, retrieving only their ports"""
+
+        topology = self.refresh_ports([aid for connection in connections for aid in connection])
+        with self._topology_cache.lock:
+            missing = [connection for connection in connections
+                       if topology.source(connection[1]) != int(connection[0])]
+        if missing:
+            raise Exception(self.__class__.__name__, "Cross-connects {0} are missing after mapping".format(
+                ', '.join('{0}->{1}'.format(*connection) for connection in missing)))
+
+    def get_cache_statistics(self):
+        """Topology cache statistics keyed by the login address, empty before login"""
+
+        if self._login_credentials is None:
+            return dict()
+        ip, port = self._login_credentials[:2]
+        address = ip if port is None else '{0}:{1}'.format(ip, port)
+        return {address: self._topology_cache.get_statistics()}
+
+    def _chassis_resource_info(self, address, system_info):
+        resource_info = ResourceInfo()
+        resource_info.set_depth(0)
+        resource_info.set_index(1)
+
+        resource_info.set_address(address)
+
+        # add chassis info
+        resource_info.add_attribute("Vendor", system_info.vendor)
+        resource_info.add_attribute("Type", system_info.type)
+        resource_info.add_attribute("Version", system_info.version)
+        resource_info.add_attribute("Model", system_info.model)
+
+        resource_info.set_model_name(system_info.model)
+        resource_info.set_serial_number(system_info.serial)
+        return resource_info
+
+    def _port_descriptions(self, topology, address_prefix):
+        """Yield (child key, index, mapping or None, enabled) of each port, in the order ports are added to chassis"""
+
+        if self._port_logical_mode.lower() == "logical":
+            paired_out, port_state = self._build_logical_port_map(topology)
+
+            def port_address(number):
+                return '{0}-{1}'.format(number, paired_out[number])
+
+            # ports are added in the order of a dict keyed by port number string, ResourceInfo output depends on it
+            for logical_port_key in dict.fromkeys(str(topology.port(aid)[1]) for aid in topology.port_aids):
+                logical_port_index = int(logical_port_key)
+                if not paired_out[logical_port_index]:
+                    continue
+                mapping = None
+                src_port = topology.port(topology.source_of[logical_port_index])
+                if src_port is not None and paired_out[src_port[1]]:
+                    mapping = address_prefix + port_address(src_port[1])
+                yield (port_address(logical_port_index), port_address(logical_port_index), mapping,
+                       port_state[logical_port_index])
         else:
+            for aid in topology.port_aids:
+                port_id = str(aid)
+                dst_aid = topology.target(aid)
+                yield port_id, port_id, address_prefix + str(dst_aid) if dst_aid else None, topology.is_good(aid)
+
+    def _write_resource_description(self, address, system_info, topology):
+        """Resource description rendered from pre-rendered ResourceInfo fragments, None if they can't be used"""
+
+        address_prefix = address + "/"
+        # templates and chassis fragments stay valid as long as the address and system info do
+        writer_key = (address, system_info)
+        if self._resource_description_writer is None or self._resource_description_writer[0] != writer_key:
+            writer = ResourceDescriptionWriter(lambda: self._chassis_resource_info(address, system_info),
+                                               system_info.model, address_prefix)
+            self._resource_description_writer = (writer_key, writer if writer.prepare() else None)
+
+        writer = self._resource_description_writer[1]
+        if writer is None:
+            return None
+        try:
+            return writer.render(self._port_descriptions(topology, address_prefix))
+        except ValueError:
+            return None
+
+    def get_resource_description(self, address, command_logger=None, force_refresh=False):
+        if self._service_mode.lower() != "tl1":
             raise Exception(self.__class__.__name__,
                             "Selected '{}' connection type is not supported".format(self._service_mode))
 
-        return self._resource_info.convert_to_xml()
+        timer = statistics.timer('driver.get_resource_description') if statistics.enabled else None
+        topology = self._get_topology(force_refresh)
+        if timer is not None:
+            timer.mark('topology')
+        if self._topology_cache.stale and command_logger is not None:
+            command_logger.info('Topology comes from a snapshot, it is not retrieved from the device yet')
+
+        # the listener may change the topology in place meanwhile
+        with self._topology_cache.lock:
+            resource_description = self._render_resource_description(address, topology, timer)
+
+        if timer is not None:
+            timer.mark('xml')
+            timer.finish(len(resource_description))
+        return resource_description
+
+    def _render_resource_description(self, address, topology, timer):
+        system_info = topology.system_info
+        if system_info is None:
+            raise Exception(self.__class__.__name__, "Can't parse model info!")
+
+        resource_description = None
+        if self._stream_resource_description:
+            resource_description = self._write_resource_description(address, system_info, topology)
+            self._resource_info = None
+
+        if resource_description is None:
+            # get port mappings and port info
+            self._resource_info = self._chassis_resource_info(address, system_info)
+            for key, index, mapping, enabled in self._port_descriptions(topology, address + "/"):
+                port_resource_info = ResourceInfo()
+                port_resource_info.set_depth(1)
+                port_resource_info.set_index(index)
+                port_resource_info.set_model_name(system_info.model)
+                if mapping is not None:
+                    port_resource_info.set_mapping(mapping)
+                port_resource_info.add_attribute("State", "Enable" if enabled else "Disable")
+                port_resource_info.add_attribute("Protocol Type", 0)
+                self._resource_info.add_child(key, port_resource_info)
+
+            if timer is not None:
+                timer.mark('resource_info')
+            resource_description = self._resource_info.convert_to_xml()
+
+        return resource_description
+
+    def _port_aids(self, port_address):
+        """(IN AID, OUT AID) of logical port address 'IN-OUT'"""
+
+        in_number, out_number = str(port_address).split('-')
+        with self._topology_cache.lock:
+            topology = self._topology_cache.topology
+            if topology is None:
+                return IN_PORT_BASE + int(in_number), OUT_PORT_BASE + int(out_number)
+
+            return topology.in_port_aid(in_number), topology.out_port_aid(out_number)
+
+    def _plan_map_uni(self, src_port, dst_port):
+        if self._port_logical_mode.lower() == "logical":
+            src_in_port = self._port_aids(src_port[1])[0]
+            dst_out_port = self._port_aids(dst_port[1])[1]
+        else:
+            src_in_port = min(int(src_port[1]), int(dst_port[1]))
 
-    def map_uni(self, src_port, dst_port, command_logger=None):
-        if self._service_mode.lower() == u"tl1":
-            if self._port_logical_mode.lower() == "logical":
-                src_in_port = str(10000 + int(src_port[1].split('-')[0]))
-                dst_out_port = str(20000 + int(dst_port[1].split('-')[1]))
-            else:
-                src_in_port = min(int(src_port[1]), int(dst_port[1]))
+            dst_out_port = max(int(src_port[1]), int(dst_port[1]))
 
-                dst_out_port = max(int(src_port[1]), int(dst_port[1]))
+        return _MapPlan(request=MapRequest(MapRequest.CONNECT, [src_in_port], [dst_out_port]),
+                        update=lambda topology: topology.connect(src_in_port, dst_out_port),
+                        connections=[(src_in_port, dst_out_port)], log=True)
 
-            command = "ent-crs-fiber::{0},{1}:{2};".format(src_in_port, dst_out_port, self._incr_ctag())
-            command_result = self._session.send_command(command, re_string=self._prompt)
-            command_logger.info(command_result)
-        else:
+    def _plan_map_bidi(self, src_port, dst_port):
+        if self._port_logical_mode.lower() != "logical":
             raise Exception(self.__class__.__name__,
-                            "Selected '{}' connection type is not supported".format(self._service_mode))
+                            "Bidirectional mapping supported only in logical port mode".format(self._service_mode))
 
-    def map_bidi(self, src_port, dst_port, command_logger=None):
-        if self._service_mode.lower() == u"tl1":
-            if self._port_logical_mode.lower() == "logical":
-                source_port = str(src_port[1]).split('-')
-                destination_port = str(dst_port[1]).split('-')
-                src_in_port = str(10000 + int(source_port[0]))
-                dst_in_port = str(10000 + int(destination_port[0]))
-                src_out_port = str(20000 + int(source_port[1]))
-                dst_out_port = str(20000 + int(destination_port[1]))
-
-                command = "ent-crs-fiber::{0}&{1},{2}&{3}:{4};".format(src_in_port, dst_in_port, dst_out_port,
-                                                                       src_out_port, self._incr_ctag())
-                command_result = self._session.send_command(command, re_string=self._prompt)
-                command_logger.info(command_result)
-            else:
-                raise Exception(self.__class__.__name__,
-                                "Bidirectional mapping supported only in logical port mode".format(self._service_mode))
-        else:
-            raise Exception(self.__class__.__name__,
-                            "Selected '{}' connection type is not supported".format(self._service_mode))
+        src_in_port, src_out_port = self._port_aids(src_port[1])
+        dst_in_port, dst_out_port = self._port_aids(dst_port[1])
 
-    def map_clear_to(self, src_port, dst_port, command_logger=None):
-        if self._service_mode.lower() == "tl1":
-            src_in_port = src_port[1]
-            if self._port_logical_mode.lower() == "logical":
-                source_port = src_port[1].split('-')
-                src_in_port = str(10000 + int(source_port[0]))
+        def update(topology):
+            topology.connect(src_in_port, dst_out_port)
+            topology.connect(dst_in_port, src_out_port)
 
-            command = "dlt-crs-fiber::{0}:{1};".format(src_in_port, self._incr_ctag())
+        return _MapPlan(request=MapRequest(MapRequest.CONNECT, [src_in_port, dst_in_port],
+                                           [dst_out_port, src_out_port]),
+                        update=update, connections=[(src_in_port, dst_out_port), (dst_in_port, src_out_port)],
+                        log=True)
 
-            self._session.send_command(command, re_string=self._prompt)
-        else:
+    def _plan_map_clear_to(self, src_port, dst_port):
+        src_in_port = src_port[1]
+        if self._port_logical_mode.lower() == "logical":
+            src_in_port = self._port_aids(src_port[1])[0]
+
+        return _MapPlan(request=MapRequest(MapRequest.DISCONNECT, [src_in_port]),
+                        update=lambda topology: topology.disconnect(src_in_port), connections=None, log=False)
+
+    def _plan_map_clear(self, src_port, dst_port):
+        if self._port_logical_mode.lower() != "logical":
+            return self._plan_map_clear_to(src_port, dst_port)
+
+        src_in_port = self._port_aids(src_port[1])[0]
+        dst_in_port = self._port_aids(dst_port[1])[0]
+
+        def update(topology):
+            topology.disconnect(src_in_port)
+            topology.disconnect(dst_in_port)
+
+        return _MapPlan(request=MapRequest(MapRequest.DISCONNECT, [src_in_port, dst_in_port]),
+                        update=update, connections=None, log=False)
+
+    def _plan_map(self, method_name, src_port, dst_port):
+        if self._service_mode.lower() != "tl1":
             raise Exception(self.__class__.__name__,
                             "Selected '{}' connection type is not supported".format(self._service_mode))
 
-    def map_clear(self, src_port, dst_port, command_logger=None):
-        if self._service_mode.lower() == "tl1":
-            if self._port_logical_mode.lower() == "logical":
-                source_port = src_port[1].split('-')
-                destination_port = dst_port[1].split('-')
-                src_in_port = str(10000 + int(source_port[0]))
-                dst_in_port = str(10000 + int(destination_port[0]))
+        return getattr(self, '_plan_' + method_name)(src_port, dst_port)
+
+    def _finish_map(self, plan, command_logger):
+        request = plan.request
+        if plan.log and command_logger is not None:
+            command_logger.info(request.result)
+        self._update_topology(request.completed, plan.update)
+        if self._verify_map and plan.connections and request.completed:
+            self._verify_connections(plan.connections)
+
+    def map_batch(self, calls):
+        """Run map requests with their cross-connects merged into as few commands as the batcher can
+
+        :param calls: list of (method name, src_port, dst_port, command_logger), method names of map_uni, map_bidi,
+            map_clear_to and map_clear
+        :return: list with None for each request done and the exception of each failed one
+        """
+
+        plans = list()
+        errors = list()
+        for method_name, src_port, dst_port, _ in calls:
+            try:
+                plans.append(self._plan_map(method_name, src_port, dst_port))
+                errors.append(None)
+            except Exception as error:
+                plans.append(None)
+                errors.append(error)
+
+        self._map_batcher.execute([plan.request for plan in plans if plan is not None])
+
+        for index, (plan, call) in enumerate(zip(plans, calls)):
+            if plan is None:
+                continue
+            if plan.request.error is not None:
+                errors[index] = plan.request.error
+                continue
+            try:
+                self._finish_map(plan, call[3])
+            except Exception as error:
+                errors[index] = error
+        return errors
+
+    def _map(self, method_name, src_port, dst_port, command_logger):
+        error = self.map_batch([(method_name, src_port, dst_port, command_logger)])[0]
+        if error is not None:
+            raise error
+
+    @statistics.timed('driver.map_uni')
+    def map_uni(self, src_port, dst_port, command_logger=None):
+        self._map('map_uni', src_port, dst_port, command_logger)
 
-                command = "dlt-crs-fiber::{0}&{1}:{2};".format(src_in_port, dst_in_port, self._incr_ctag())
+    @statistics.timed('driver.map_bidi')
+    def map_bidi(self, src_port, dst_port, command_logger=None):
+        self._map('map_bidi', src_port, dst_port, command_logger)
 
-                self._session.send_command(command, re_string=self._prompt)
-            else:
-                self.map_clear_to(src_port, dst_port, command_logger)
-        else:
+    @statistics.timed('driver.map_clear_to')
+    def map_clear_to(self, src_port, dst_port, command_logger=None):
+        self._map('map_clear_to', src_port, dst_port, command_logger)
+
+    @statistics.timed('driver.map_clear')
+    def map_clear(self, src_port, dst_port, command_logger=None):
+        self._map('map_clear', src_port, dst_port, command_logger)
+
+    def _route_aids(self, src_port, dst_port, bidirectional):
+        """(IN AID, OUT AID) cross-connects of a route"""
+
+        if self._port_logical_mode.lower() == "logical":
+            src_in_port, src_out_port = self._port_aids(src_port[1])
+            dst_in_port, dst_out_port = self._port_aids(dst_port[1])
+            if bidirectional:
+                return [(src_in_port, dst_out_port), (dst_in_port, src_out_port)]
+            return [(src_in_port, dst_out_port)]
+
+        if bidirectional:
+            raise Exception(self.__class__.__name__, "Bidirectional mapping supported only in logical port mode")
+        return [(min(int(src_port[1]), int(dst_port[1])), max(int(src_port[1]), int(dst_port[1])))]
+
+    def _port_address_aids(self, port):
+        if self._port_logical_mode.lower() == "logical":
+            return self._port_aids(port[1])
+        return int(port[1]),
+
+    def _diff_route_set(self, topology, desired, clear_ports, exclusive):
+        """IN AIDs to disconnect and (IN AID, OUT AID) to connect to get from topology to the desired route set"""
+
+        desired_by_out = dict()
+        desired_by_in = dict()
+        for in_aid, out_aid in desired:
+            if (desired_by_out.setdefault(out_aid, in_aid) != in_aid or
+                    desired_by_in.setdefault(in_aid, out_aid) != out_aid):
+                raise Exception(self.__class__.__name__,
+                                "Conflicting routes for ports {0} and {1}".format(in_aid, out_aid))
+
+        disconnect = set()
+        for in_aid, out_aid in desired_by_in.iteritems():
+            current_out_aid = topology.target(in_aid)
+            if current_out_aid and current_out_aid != out_aid:
+                disconnect.add(in_aid)
+            current_in_aid = topology.source(out_aid)
+            if current_in_aid and current_in_aid != in_aid:
+                disconnect.add(current_in_aid)
+
+        for aid in clear_ports:
+            if topology.target(aid):
+                disconnect.add(aid)
+            if topology.source(aid):
+                disconnect.add(topology.source(aid))
+
+        if exclusive:
+            for in_aid, out_aid in topology.connections:
+                if desired_by_out.get(out_aid) != in_aid:
+                    disconnect.add(in_aid)
+
+        connect = [(in_aid, out_aid) for in_aid, out_aid in sorted(desired_by_in.iteritems())
+                   if in_aid in disconnect or topology.target(in_aid) != out_aid]
+        return sorted(disconnect), connect
+
+    @statistics.timed('driver.apply_route_set')
+    def apply_route_set(self, routes, clear_ports=(), exclusive=False, command_logger=None):
+        """Bring the chassis cross-connects to the desired route set with as few changes as possible
+
+        Only cross-connects that differ from the current ones are deleted and created, in bulk commands.
+
+        :param routes: list of (src_port, dst_port, bidirectional), ports as for map_uni
+        :param clear_ports: ports which must end up without cross-connects
+        :param exclusive: delete every other cross-connect of the chassis too
+        :return: dict with 'disconnected', 'connected' and 'unchanged' counts
+        """
+
+        if self._service_mode.lower() != "tl1":
             raise Exception(self.__class__.__name__,
                             "Selected '{}' connection type is not supported".format(self._service_mode))
 
+        desired = list()
+        for src_port, dst_port, bidirectional in routes:
+            desired.extend(self._route_aids(src_port, dst_port, bidirectional))
+        clear_aids = [aid for port in clear_ports for aid in self._port_address_aids(port)]
+
+        # a live topology is up to date, otherwise the diff is made against a fresh one
+        topology = self._get_topology(force_refresh=not self._topology_cache.live)
+        with self._topology_cache.lock:
+            disconnect, connect = self._diff_route_set(topology, desired, clear_aids, exclusive)
+
+        failed = list()
+        requests = [MapRequest(MapRequest.DISCONNECT, [in_aid]) for in_aid in disconnect]
+        self._map_batcher.execute(requests)
+        for in_aid, request in zip(disconnect, requests):
+            if not request.completed:
+                failed.append(request.error or request.result)
+            self._update_topology(request.completed, lambda topology: topology.disconnect(in_aid))
+
+        requests = [MapRequest(MapRequest.CONNECT, [in_aid], [out_aid]) for in_aid, out_aid in connect]
+        self._map_batcher.execute(requests)
+        for (in_aid, out_aid), request in zip(connect, requests):
+            if not request.completed:
+                failed.append(request.error or request.result)
+            self._update_topology(request.completed, lambda topology: topology.connect(in_aid, out_aid))
+
+        if self._verify_map and connect and not failed:
+            self._verify_connections(connect)
+
+        result = {
+            'disconnected': len(disconnect),
+            'connected': len(connect),
+            'unchanged': len(set(desired)) - len(connect)
+        }
+        if command_logger is not None:
+            command_logger.info('Route set applied: {0}'.format(result))
+
+        if failed:
+            raise Exception(self.__class__.__name__,
+                            "Failed to apply route set: {0}".format('\n'.join(str(output) for output in failed)))
+        return result
+
     def set_speed_manual(self, command_logger=None):
         pass
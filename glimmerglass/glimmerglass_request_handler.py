@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from xml.sax.saxutils import quoteattr
+
+from common.request_handler import RequestHandler
+from common.xml_wrapper import XMLWrapper
+from glimmerglass.adaptive_timeouts import command_timeouts
+from glimmerglass.command_statistics import statistics
+
+
+class GlimmerglassRequestHandler(RequestHandler):
+    def get_stats(self, command_node, xs_prefix='', command_logger=None):
+        """Latency histograms of TL1 commands and driver operations, learned command timeouts, pooled sessions,
+        cached topologies, the request dispatcher
+
+        Durations are in milliseconds, Bytes is the total size of received responses. Timeout is empty until enough
+        responses of the command are observed. Idle and Age of pooled sessions and Age of cached topologies are in
+        seconds, Stale="true" marks a topology loaded from a snapshot and not retrieved from the device yet, Hits and
+        Misses count requests answered from the cache and from the device. Dispatcher is there when requests run on
+        the dispatcher worker pool, Queued is the current queue length, QueueWait and Execution the total time
+        requests waited for a worker and ran.
+        """
+
+        command_statistics = statistics.get_statistics()
+        commands_xml = ''.join(
+            '<Command Name={0} Count="{count}" P50="{p50:.3f}" P95="{p95:.3f}" P99="{p99:.3f}" '
+            'Total="{total:.3f}" Bytes="{bytes}"/>'.format(
+                quoteattr(name), count=data['count'], p50=data['p50'] * 1000, p95=data['p95'] * 1000,
+                p99=data['p99'] * 1000, total=data['total'] * 1000, bytes=data['bytes'])
+            for name, data in sorted(command_statistics.iteritems()))
+
+        timeouts_xml = ''.join(
+            '<Timeout Device={0} Name={1} Samples="{samples}" P50="{p50:.3f}" P99="{p99:.3f}" '
+            'BytesP99="{bytes_p99}" Timeouts="{timeouts}" Timeout="{2}"/>'.format(
+                quoteattr(device), quoteattr(name),
+                '{0:.3f}'.format(data['timeout'] * 1000) if data['timeout'] is not None else '',
+                samples=data['samples'], p50=data['p50'] * 1000, p99=data['p99'] * 1000,
+                bytes_p99=data['bytes_p99'], timeouts=data['timeouts'])
+            for device, device_statistics in sorted(command_timeouts.get_statistics().iteritems())
+            for name, data in sorted(device_statistics.iteritems()))
+
+        pool_statistics = self._driver_handler.get_session_pool_statistics()
+        session_pool_xml = (
+            '<SessionPool Size="{size}" MaxSize="{max_size}" Created="{created}" Reused="{reused}" '
+            'Evicted="{evicted}" KeepaliveFailures="{keepalive_failures}">{0}</SessionPool>'.format(
+                ''.join('<Session Device={0} Uses="{uses}" Relogins="{relogins}" Reconnects="{reconnects}" '
+                        'Idle="{idle:.1f}" Age="{age:.1f}"/>'.format(quoteattr(session['device']), **session)
+                        for session in pool_statistics['sessions']),
+                **pool_statistics))
+
+        topologies_xml = ''.join(
+            '<Topology Device={0} Live="{1}" Stale="{2}" Age="{3}" Ttl="{ttl}" Hits="{hits}" '
+            'Misses="{misses}"/>'.format(
+                quoteattr(device), str(data['live']).lower(), str(data['stale']).lower(),
+                '{0:.1f}'.format(data['age']) if data['age'] is not None else '', **data)
+            for device, data in sorted(self._driver_handler.get_cache_statistics().iteritems()))
+
+        dispatcher_statistics = self._driver_handler.get_dispatcher_statistics()
+        dispatcher_xml = ''
+        if dispatcher_statistics is not None:
+            dispatcher_xml = (
+                '<Dispatcher Workers="{workers}" Queued="{queued}" Active="{active}" Completed="{completed}" '
+                'Batched="{batched}" Rejected="{rejected}" QueueWait="{queue_wait:.3f}" '
+                'Execution="{execution:.3f}"/>'.format(**dict(
+                    dispatcher_statistics, queue_wait=dispatcher_statistics['queue_wait'] * 1000,
+                    execution=dispatcher_statistics['execution'] * 1000)))
+
+        return XMLWrapper.parse_xml('<Statistics Enabled="{0}">{1}{2}{3}{4}{5}</Statistics>'.format(
+            str(statistics.enabled).lower(), commands_xml, timeouts_xml, session_pool_xml, topologies_xml,
+            dispatcher_xml))
+
+    def refresh_topology(self, command_node, xs_prefix='', command_logger=None):
+        """Resource description of the chassis retrieved from the device, whatever the topology cache holds
+
+        Parameters hold Address, as for GetResourceDescription.
+        """
+
+        address = command_node.find(xs_prefix + 'Parameters').findtext(xs_prefix + 'Address')
+        return XMLWrapper.parse_xml(self._driver_handler.get_resource_description(address, command_logger,
+                                                                                  force_refresh=True))
+
+    def apply_route_set(self, command_node, xs_prefix='', command_logger=None):
+        """Bring the chassis cross-connects to the listed routes
+
+        Parameters hold Route elements with SrcPort, DstPort and optional Bidirectional, ClearPort elements for ports
+        to be left without cross-connects and optional Exclusive to delete every other cross-connect.
+        """
+
+        parameters_node = command_node.find(xs_prefix + 'Parameters')
+
+        routes = list()
+        for route_node in parameters_node.findall(xs_prefix + 'Route'):
+            routes.append((route_node.findtext(xs_prefix + 'SrcPort').split('/'),
+                           route_node.findtext(xs_prefix + 'DstPort').split('/'),
+                           _is_true(route_node.findtext(xs_prefix + 'Bidirectional'))))
+        clear_ports = [port_node.text.split('/') for port_node in parameters_node.findall(xs_prefix + 'ClearPort')]
+        exclusive = _is_true(parameters_node.findtext(xs_prefix + 'Exclusive'))
+
+        result = self._driver_handler.apply_route_set(routes, clear_ports, exclusive, command_logger)
+
+        return XMLWrapper.parse_xml('<RouteSet Disconnected="{disconnected}" Connected="{connected}" '
+                                    'Unchanged="{unchanged}"/>'.format(**result))
+
+
+def _is_true(text):
+    return (text or '').strip().lower() in ('true', '1', 'yes')
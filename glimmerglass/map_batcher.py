@@ -0,0 +1,283 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+import threading
+import time
+
+
+class MapRequest(object):
+    CONNECT = 'ent-crs-fiber'
+    DISCONNECT = 'dlt-crs-fiber'
+
+    def __init__(self, verb, in_ports, out_ports=()):
+        self.verb = verb
+        self.in_ports = [str(port) for port in in_ports]
+        self.out_ports = [str(port) for port in out_ports]
+
+        self.result = None
+        self.error = None
+        # the cross-connects were found in place on the device after a partly completed merged command
+        self.confirmed = False
+        self.done = threading.Event()
+
+    @property
+    def size(self):
+        return len(self.in_ports)
+
+    @property
+    def aids(self):
+        return [int(port) for port in self.in_ports + self.out_ports]
+
+    @property
+    def completed(self):
+        return self.confirmed or (self.result is not None and re.search(r'COMPLD', self.result) is not None)
+
+    def is_applied(self, topology):
+        """Check the device topology has the change of the request
+
+        :param topology: DeviceTopology holding the request ports as retrieved from the device
+        """
+
+        if self.verb == self.CONNECT:
+            return all(topology.source(out_port) == int(in_port)
+                       for in_port, out_port in zip(self.in_ports, self.out_ports))
+        return all(not topology.target(in_port) for in_port in self.in_ports)
+
+    def set_result(self, result):
+        self.result = result
+        self.done.set()
+
+    def set_error(self, error):
+        self.error = error
+        self.done.set()
+
+
+class CrossConnectBatcher(object):
+    """Merge map requests waiting for the session into multi-AID 'ent-crs-fiber'/'dlt-crs-fiber' commands
+
+    Requests are merged when they are queued together: the requests of one execute() call, as from apply_route_set
+    or map requests DispatchingDriverHandler found queued for a chassis, and connect()/disconnect() calls of
+    concurrent callers.
+
+    The first caller flushes the queue: it waits up to 'window' seconds (or until 'max_ports' AIDs are queued),
+    then sends merged commands, pipelined when 'send_commands' is given, while requests submitted meanwhile join the
+    next round. A request is never split between commands. A denied merged command is replayed request by request,
+    so each caller gets the device output of a command covering its own ports. After a partly completed one the
+    ports are retrieved with 'refresh_ports' and only requests whose change isn't in place are replayed, the others
+    are marked confirmed.
+    """
+
+    def __init__(self, send_command, next_ctag, window=0, max_ports=1, send_commands=None, refresh_ports=None):
+        """
+        :param send_command: callable(command) returning device output
+        :param send_commands: optional callable([(ctag, command), ...]) sending commands pipelined and returning
+            a list of device outputs
+        :param next_ctag: callable returning next correlation tag
+        :param window: seconds to wait for more requests before flushing, only useful when connect()/disconnect()
+            have concurrent callers, it delays every single request otherwise
+        :param max_ports: max AIDs in a single command
+        :param refresh_ports: optional callable(aids) retrieving the ports from the device and returning
+            DeviceTopology, without it a partly completed merged command is reported to all its requests
+        """
+
+        self._send_command = send_command
+        self._send_commands = send_commands
+        self._refresh_ports = refresh_ports
+        self._next_ctag = next_ctag
+        self._window = window or 0
+        self._max_ports = max(max_ports or 1, 1)
+
+        self._condition = threading.Condition()
+        self._pending = list()
+        self._flushing = False
+
+        self.requests_count = 0
+        self.commands_count = 0
+
+    def connect(self, in_ports, out_ports):
+        return self._submit(MapRequest(MapRequest.CONNECT, in_ports, out_ports))
+
+    def disconnect(self, in_ports):
+        return self._submit(MapRequest(MapRequest.DISCONNECT, in_ports))
+
+    def execute(self, requests):
+        """Submit several MapRequest at once, they are merged with each other like concurrent requests
+
+        :return: list of device outputs or exceptions, one per request
+        """
+
+        self._enqueue(requests)
+
+        results = list()
+        for request in requests:
+            request.done.wait()
+            results.append(request.error if request.error is not None else request.result)
+        return results
+
+    def _enqueue(self, requests):
+        with self._condition:
+            self._pending.extend(requests)
+            self.requests_count += len(requests)
+            self._condition.notify()
+            is_leader = not self._flushing
+            self._flushing = True
+
+        if is_leader:
+            self._flush()
+
+    def _submit(self, request):
+        self._enqueue([request])
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+        return request.result
+
+    def _wait_window(self):
+        deadline = time.time() + self._window
+        with self._condition:
+            while sum(request.size for request in self._pending) < self._max_ports:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+    def _flush(self):
+        if self._window > 0:
+            self._wait_window()
+
+        while True:
+            with self._condition:
+                requests = self._pending
+                self._pending = list()
+                if not requests:
+                    self._flushing = False
+                    return
+
+            self._execute(self._split(requests))
+
+    def _split(self, requests):
+        """Group requests by verb into batches with unique AIDs under the size limit
+
+        A request may join an earlier batch of the same verb as long as no batch in between touches its ports,
+        so the device sees the same end state as if requests were sent one by one.
+        """
+
+        batches = list()
+        for request in requests:
+            request_ports = set(request.in_ports + request.out_ports)
+            target = None
+            for batch, batch_ports in reversed(batches):
+                if batch_ports & request_ports:
+                    break
+                if batch[0].verb == request.verb and \
+                        sum(item.size for item in batch) + request.size <= self._max_ports:
+                    target = (batch, batch_ports)
+                    break
+
+            if target is None:
+                batches.append(([request], request_ports))
+            else:
+                target[0].append(request)
+                target[1].update(request_ports)
+
+        return [batch for batch, _ in batches]
+
+    def _build_command(self, batch):
+        ctag = self._next_ctag()
+        in_ports = '&'.join(port for request in batch for port in request.in_ports)
+        if batch[0].verb == MapRequest.CONNECT:
+            out_ports = '&'.join(port for request in batch for port in request.out_ports)
+            return ctag, "{0}::{1},{2}:{3};".format(MapRequest.CONNECT, in_ports, out_ports, ctag)
+
+        return ctag, "{0}::{1}:{2};".format(MapRequest.DISCONNECT, in_ports, ctag)
+
+    def _send(self, batches):
+        """Send a command per batch, pipelined when possible
+
+        :return: list of device outputs or exceptions, one per batch
+        """
+
+        commands = [self._build_command(batch) for batch in batches]
+        self.commands_count += len(commands)
+        if self._send_commands is not None and len(commands) > 1:
+            try:
+                return self._send_commands(commands)
+            except Exception as error:
+                return [error] * len(commands)
+
+        results = list()
+        for ctag, command in commands:
+            try:
+                results.append(self._send_command(command))
+            except Exception as error:
+                results.append(error)
+        return results
+
+    def _execute(self, batches):
+        """Send batches in rounds of batches without common ports
+
+        Batches in a round commute, so replaying a failed merged batch after the rest of its round was sent
+        leaves the device in the same state as sending the requests one by one.
+        """
+
+        round_batches = list()
+        round_ports = set()
+        for batch in batches:
+            batch_ports = set(port for request in batch for port in request.in_ports + request.out_ports)
+            if round_ports & batch_ports:
+                self._execute_round(round_batches)
+                round_batches = list()
+                round_ports = set()
+
+            round_batches.append(batch)
+            round_ports |= batch_ports
+
+        if round_batches:
+            self._execute_round(round_batches)
+
+    def _execute_round(self, batches):
+        retry_batches = list()
+        for batch, command_result in zip(batches, self._send(batches)):
+            if isinstance(command_result, Exception):
+                for request in batch:
+                    request.set_error(command_result)
+            elif len(batch) > 1 and re.search(r'DENY', command_result):
+                # a denied command changes nothing, find the requests the device denies
+                retry_batches.extend([request] for request in batch)
+            elif len(batch) > 1 and re.search(r'PRTL', command_result):
+                retry_batches.extend([request] for request in self._confirm_partial(batch, command_result))
+            else:
+                for request in batch:
+                    request.set_result(command_result)
+
+        if retry_batches:
+            self._execute_round(retry_batches)
+
+    def _confirm_partial(self, batch, command_result):
+        """Complete the requests of a partly completed command which are in place on the device
+
+        :return: requests to be replayed
+        """
+
+        topology = None
+        if self._refresh_ports is not None:
+            try:
+                topology = self._refresh_ports(sorted(set(aid for request in batch for aid in request.aids)))
+            except Exception:
+                logging.getLogger(__name__).warning('Failed to retrieve ports of a partly completed command',
+                                                    exc_info=True)
+
+        replay = list()
+        for request in batch:
+            if topology is None:
+                request.set_result(command_result)
+            elif request.is_applied(topology):
+                request.confirmed = True
+                request.set_result(command_result)
+            else:
+                replay.append(request)
+        return replay
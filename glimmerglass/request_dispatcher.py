@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from collections import deque
+
+from glimmerglass.command_statistics import statistics
+
+
+class _Request(object):
+    def __init__(self, name, function, args, kwargs, batch_function=None, item=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.batch_function = batch_function
+        self.item = item
+
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class RequestDispatcher(object):
+    """Run requests on a pool of worker threads, one request per key at a time in submission order
+
+    Requests of different keys (devices) run in parallel up to 'workers', requests of one key never overlap, so
+    TL1 command order of a device is kept. Callers block until their request is done. A worker taking a batched
+    request also takes the requests of the same batch function queued right behind it and runs them in one call.
+    """
+
+    def __init__(self, workers=8, queue_depth=64):
+        """
+        :param workers: worker threads
+        :param queue_depth: max requests waiting for a worker, 0 for no limit
+        """
+
+        self._workers_count = max(workers or 8, 1)
+        self._queue_depth = queue_depth or 0
+
+        self._condition = threading.Condition()
+        # key -> deque of requests
+        self._queues = dict()
+        # keys with queued requests and no worker running them
+        self._ready_keys = deque()
+        self._active_keys = set()
+        self._queued_count = 0
+        self._workers = list()
+
+        self.completed_count = 0
+        self.batched_count = 0
+        self.rejected_count = 0
+        self.queue_wait_time = 0.0
+        self.execution_time = 0.0
+
+    def _start_workers(self):
+        while len(self._workers) < self._workers_count:
+            worker = threading.Thread(target=self._worker_loop, name='RequestWorker-{0}'.format(len(self._workers)))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def call(self, key, name, function, *args, **kwargs):
+        """Run function(*args, **kwargs) after earlier requests of the key and return its result
+
+        :param key: serialization key, device address
+        :param name: request name for statistics
+        :raise Exception: request queue is full
+        """
+
+        return self._run(key, _Request(name, function, args, kwargs))
+
+    def call_batched(self, key, name, batch_function, item):
+        """Run batch_function with the item and the items of requests of the same function queued right behind it
+
+        :param batch_function: callable([item, ...]) returning a list with the result of each item, an exception
+            instance for an item which failed
+        :return: result of the item
+        :raise Exception: the item failed or request queue is full
+        """
+
+        result = self._run(key, _Request(name, None, (), dict(), batch_function, item))
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run(self, key, request):
+        with self._condition:
+            if self._queue_depth and self._queued_count >= self._queue_depth:
+                self.rejected_count += 1
+                raise Exception(self.__class__.__name__,
+                                "Request queue is full, {0} requests waiting".format(self._queued_count))
+
+            self._start_workers()
+            self._queues.setdefault(key, deque()).append(request)
+            self._queued_count += 1
+            if key not in self._active_keys and len(self._queues[key]) == 1:
+                self._ready_keys.append(key)
+                self._condition.notify()
+
+        request.done.wait()
+
+        if statistics.enabled:
+            statistics.record('dispatch.{0}.queue_wait'.format(request.name),
+                              request.start_time - request.submit_time)
+            statistics.record('dispatch.{0}.execution'.format(request.name), request.end_time - request.start_time)
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._ready_keys:
+                    self._condition.wait()
+                key = self._ready_keys.popleft()
+                self._active_keys.add(key)
+                queue = self._queues[key]
+                requests = [queue.popleft()]
+                if requests[0].batch_function is not None:
+                    while queue and queue[0].batch_function == requests[0].batch_function:
+                        requests.append(queue.popleft())
+                self._queued_count -= len(requests)
+
+            start_time = time.time()
+            self._execute(requests)
+            end_time = time.time()
+
+            with self._condition:
+                self._active_keys.discard(key)
+                if self._queues[key]:
+                    self._ready_keys.append(key)
+                    self._condition.notify()
+                else:
+                    del self._queues[key]
+                self.completed_count += len(requests)
+                self.batched_count += len(requests) - 1
+                for request in requests:
+                    request.start_time = start_time
+                    request.end_time = end_time
+                    self.queue_wait_time += start_time - request.submit_time
+                    self.execution_time += end_time - start_time
+
+            for request in requests:
+                request.done.set()
+
+    def _execute(self, requests):
+        name = requests[0].name
+        try:
+            if requests[0].batch_function is not None:
+                results = requests[0].batch_function([request.item for request in requests])
+                for request, result in zip(requests, results):
+                    request.result = result
+            else:
+                requests[0].result = requests[0].function(*requests[0].args, **requests[0].kwargs)
+        except Exception as error:
+            for request in requests:
+                request.error = error
+        except BaseException:
+            logging.getLogger(__name__).exception('Request {0} failed'.format(name))
+            for request in requests:
+                request.error = Exception(self.__class__.__name__, 'Request {0} failed'.format(name))
+
+    def get_statistics(self):
+        with self._condition:
+            return {
+                'workers': self._workers_count,
+                'queue_depth': self._queue_depth,
+                'queued': self._queued_count,
+                'active': len(self._active_keys),
+                'completed': self.completed_count,
+                'batched': self.batched_count,
+                'rejected': self.rejected_count,
+                'queue_wait': self.queue_wait_time,
+                'execution': self.execution_time
+            }
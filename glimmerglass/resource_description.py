@@ -0,0 +1,145 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import re
+from collections import OrderedDict
+
+from common.resource_info import ResourceInfo
+
+_INDEX_SENTINEL = 'GgIndexSentinel'
+_MAPPING_SENTINEL = 'GgMappingSentinel'
+_SENTINEL_RE = re.compile('({0}|{1})'.format(_INDEX_SENTINEL, _MAPPING_SENTINEL))
+# characters ResourceInfo may escape or reject, values containing them are never templated
+_UNSAFE_RE = re.compile(r'[&<>"\'{}\x00-\x1f]')
+
+# keys of the probe children, chosen so that insertion, dict and sorted order all differ
+_PROBE_KEYS = ['9-9', '10-10', '1-1', '100-100', '2-2', '12-3']
+_CHILD_ORDERS = [
+    lambda ports: dict(ports),
+    lambda ports: OrderedDict(ports),
+    lambda ports: OrderedDict(sorted(ports)),
+]
+
+
+class ResourceDescriptionWriter(object):
+    """Write resource description XML of a chassis without building a ResourceInfo per port
+
+    Chassis wrapper and port elements are rendered once by ResourceInfo itself, with sentinel values in place of the
+    port index and mapping, and split into constant fragments. prepare() returns False whenever ResourceInfo output
+    doesn't split cleanly, the caller then has to build ResourceInfo objects as usual. A prepared writer renders any
+    number of topologies of the chassis.
+    """
+
+    def __init__(self, chassis_factory, model_name, address_prefix):
+        """
+        :param chassis_factory: callable returning a new ResourceInfo of the chassis, without children
+        :param model_name: model name of every port
+        :param address_prefix: '<chassis address>/' prefix of port mappings
+        """
+
+        self._chassis_factory = chassis_factory
+        self._model_name = model_name
+        self._address_prefix = address_prefix
+
+        self._prefix = None
+        self._suffix = None
+        self._child_order = None
+        # (mapped, enabled) -> format string with {0} for index and {1} for mapping
+        self._templates = dict()
+        self._verified = set()
+
+    def _port_resource_info(self, index, mapping, enabled):
+        port_resource_info = ResourceInfo()
+        port_resource_info.set_depth(1)
+        port_resource_info.set_index(index)
+        port_resource_info.set_model_name(self._model_name)
+        if mapping is not None:
+            port_resource_info.set_mapping(mapping)
+        port_resource_info.add_attribute("State", "Enable" if enabled else "Disable")
+        port_resource_info.add_attribute("Protocol Type", 0)
+        return port_resource_info
+
+    def _render_template(self, mapped, enabled):
+        xml = self._port_resource_info(_INDEX_SENTINEL, _MAPPING_SENTINEL if mapped else None,
+                                       enabled).convert_to_xml()
+        if not isinstance(xml, basestring) or _INDEX_SENTINEL not in xml or \
+                (mapped and _MAPPING_SENTINEL not in xml):
+            return None
+
+        parts = _SENTINEL_RE.split(xml)
+        template = list()
+        for position, part in enumerate(parts):
+            if position % 2 == 0:
+                template.append(part.replace('{', '{{').replace('}', '}}'))
+            else:
+                template.append('{0}' if part == _INDEX_SENTINEL else '{1}')
+        return ''.join(template)
+
+    def _probe_chassis(self):
+        """Find chassis XML around the children and the order ResourceInfo writes children in"""
+
+        probe_children = [(key, self._port_resource_info(key, None, True).convert_to_xml()) for key in _PROBE_KEYS]
+        chassis_resource_info = self._chassis_factory()
+        for key, _ in probe_children:
+            chassis_resource_info.add_child(key, self._port_resource_info(key, None, True))
+        chassis_xml = chassis_resource_info.convert_to_xml()
+        if not isinstance(chassis_xml, basestring):
+            return False
+
+        for order in _CHILD_ORDERS:
+            children_xml = ''.join(order(probe_children).itervalues())
+            position = chassis_xml.find(children_xml)
+            if position >= 0 and chassis_xml.find(children_xml, position + 1) < 0:
+                self._prefix = chassis_xml[:position]
+                self._suffix = chassis_xml[position + len(children_xml):]
+                self._child_order = order
+                return True
+
+        return False
+
+    def prepare(self):
+        """
+        :return: True if ports can be written from templates
+        """
+
+        if _UNSAFE_RE.search(self._address_prefix) or _UNSAFE_RE.search(str(self._model_name)):
+            return False
+
+        try:
+            for mapped in (False, True):
+                for enabled in (False, True):
+                    template = self._render_template(mapped, enabled)
+                    if template is None:
+                        return False
+                    self._templates[(mapped, enabled)] = template
+            return self._probe_chassis()
+        except Exception:
+            return False
+
+    def _render_port(self, index, mapping, enabled):
+        template_key = (mapping is not None, bool(enabled))
+        port_xml = self._templates[template_key].format(index, mapping)
+        if template_key not in self._verified:
+            # first port of each kind is checked against ResourceInfo output
+            if port_xml != self._port_resource_info(index, mapping, enabled).convert_to_xml():
+                raise ValueError('Port template does not match ResourceInfo output')
+            self._verified.add(template_key)
+        return port_xml
+
+    def render(self, ports):
+        """Chassis XML
+
+        :param ports: iterable of (key, index, mapping or None, enabled), keys as passed to ResourceInfo.add_child
+        :raise ValueError: port doesn't render as ResourceInfo would
+        """
+
+        ordered_ports = self._child_order((key, (index, mapping, enabled)) for key, index, mapping, enabled in ports)
+        for index, mapping, enabled in ordered_ports.itervalues():
+            if _UNSAFE_RE.search(str(index)) or (mapping is not None and _UNSAFE_RE.search(mapping)):
+                raise ValueError('Unexpected characters in port {0}'.format(index))
+
+        parts = [self._prefix]
+        parts.extend(self._render_port(index, mapping, enabled)
+                     for index, mapping, enabled in ordered_ports.itervalues())
+        parts.append(self._suffix)
+        return ''.join(parts)
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import select
+import socket
+import SocketServer
+import threading
+import time
+from Queue import Queue
+
+from common.server_connection import ServerConnection
+
+
+class _RelayHandler(SocketServer.BaseRequestHandler):
+    _chunk_size = 65536
+
+    def handle(self):
+        backend_port = self.server.free_backends.get()
+        backend = None
+        try:
+            backend = self.server.connect_backend(backend_port)
+            self._relay(self.request, backend)
+        except Exception:
+            logging.getLogger(__name__).warning('Connection relay failed', exc_info=True)
+        finally:
+            if backend is not None:
+                try:
+                    backend.close()
+                except Exception:
+                    pass
+            self.server.free_backends.put(backend_port)
+
+    def _relay(self, client, backend):
+        peers = {client: backend, backend: client}
+        while True:
+            readable, _, _ = select.select(peers.keys(), [], [])
+            for source in readable:
+                data = source.recv(self._chunk_size)
+                if not data:
+                    return
+                peers[source].sendall(data)
+
+
+class ServerRelay(SocketServer.ThreadingTCPServer):
+    """Accept CloudShell connections on the driver port and relay each one to a ServerConnection of its own
+
+    A ServerConnection serves the requests of its connections one after another on the thread it listens on, so a
+    slow request to one chassis would hold the requests of every other connection. The relay starts 'connections'
+    ServerConnection backends on local ports, sharing the RequestManager, and gives each accepted connection a free
+    backend until it is closed, so requests of different connections run at once and reach
+    DispatchingDriverHandler concurrently. Connections above 'connections' wait for a backend to be freed.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    _backend_host = '127.0.0.1'
+    # longest wait for a backend to start listening, seconds
+    _backend_start_timeout = 10
+
+    def __init__(self, host, port, request_manager, exe_folder, connections=8):
+        """
+        :param host: address to listen on
+        :param port: driver port
+        :param request_manager: RequestManager shared by the backends
+        :param exe_folder: driver folder, passed to ServerConnection
+        :param connections: backends, max connections served at once
+        """
+
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), _RelayHandler)
+
+        self.free_backends = Queue()
+        for _ in range(max(connections or 1, 1)):
+            backend_port = self._free_port()
+            server_connection = ServerConnection(self._backend_host, backend_port, request_manager, exe_folder)
+            backend_thread = threading.Thread(target=server_connection.start_listeninig,
+                                              name='ServerConnection-{0}'.format(backend_port))
+            backend_thread.daemon = True
+            backend_thread.start()
+            self.free_backends.put(backend_port)
+
+    def _free_port(self):
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            probe.bind((self._backend_host, 0))
+            return probe.getsockname()[1]
+        finally:
+            probe.close()
+
+    def connect_backend(self, backend_port):
+        deadline = time.time() + self._backend_start_timeout
+        while True:
+            try:
+                return socket.create_connection((self._backend_host, backend_port))
+            except socket.error:
+                # the backend may not be listening yet right after start
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def start_listening(self):
+        self.serve_forever()
@@ -0,0 +1,283 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+import threading
+import socket
+import time
+from collections import OrderedDict
+
+from common.cli.exceptions import SessionLoopLimitException
+
+
+class PooledSession(object):
+    """Authenticated device session owned by SessionPool
+
+    Commands are serialized with a lock shared with the pool maintenance thread. The underlying session can be
+    swapped for a freshly authenticated one at any time between commands. A command failing on the connection, or
+    getting no response in time, fails its caller and the session is reconnected for the next one, it is never
+    sent again.
+    """
+
+    def __init__(self, key, session_factory, login, keepalive):
+        """
+        :param key: pool key
+        :param session_factory: callable returning a new unconnected session
+        :param login: callable(session) connecting and authenticating the session, returns device output
+        :param keepalive: callable(session) sending a cheap command, returns device output
+        """
+
+        self.key = key
+        self._session_factory = session_factory
+        self._login = login
+        self._keepalive = keepalive
+        self._lock = threading.RLock()
+
+        self._session = None
+        self.login_output = ''
+        self.login_time = 0
+        self.last_used = 0
+        self.use_count = 0
+        self.relogin_count = 0
+        self.reconnect_count = 0
+
+    @property
+    def lock(self):
+        return self._lock
+
+    def open(self):
+        session = self._session_factory()
+        login_output = self._login(session)
+        with self._lock:
+            previous_session = self._session
+            self._session = session
+            self.login_output = login_output
+            self.login_time = self.last_used = time.time()
+
+        if previous_session is not None:
+            self._close_session(previous_session)
+
+        return login_output
+
+    def relogin(self):
+        self.relogin_count += 1
+        return self.open()
+
+    def reconnect(self):
+        self.reconnect_count += 1
+        return self.open()
+
+    def close(self):
+        with self._lock:
+            session = self._session
+            self._session = None
+
+        if session is not None:
+            self._close_session(session)
+
+    @staticmethod
+    def _close_session(session):
+        try:
+            session.disconnect()
+        except Exception:
+            logging.getLogger(__name__).debug('Failed to close session', exc_info=True)
+
+    def is_connected(self):
+        """True while the session is open and the device hasn't closed its connection"""
+
+        session = self._session
+        if session is None:
+            return False
+        # a session running a command finds out by itself
+        if not self._lock.acquire(False):
+            return True
+        try:
+            return session.is_alive()
+        finally:
+            self._lock.release()
+
+    def is_open(self):
+        return self._session is not None
+
+    def keepalive(self):
+        with self._lock:
+            self.last_used = time.time()
+            return self._keepalive(self._session)
+
+    def _call(self, method_name, *args, **kwargs):
+        with self._lock:
+            if self._session is None:
+                raise Exception(self.__class__.__name__, "Session is closed, get it from the pool again")
+            self.last_used = time.time()
+            self.use_count += 1
+            try:
+                return getattr(self._session, method_name)(*args, **kwargs)
+            except (socket.error, SessionLoopLimitException):
+                self._reconnect_after_failure()
+                raise
+
+    def _reconnect_after_failure(self):
+        session = self._session
+        self._session = None
+        self._close_session(session)
+        try:
+            self.reconnect()
+        except Exception:
+            # the holder gets a new session from the pool
+            logging.getLogger(__name__).warning('Failed to reconnect session', exc_info=True)
+
+    def send_command(self, *args, **kwargs):
+        return self._call('send_command', *args, **kwargs)
+
+    def send_pipelined(self, *args, **kwargs):
+        return self._call('send_pipelined', *args, **kwargs)
+
+
+class SessionPool(object):
+    """Authenticated sessions keyed by device address and credentials, shared by all handlers of the process
+
+    A maintenance thread sends a keepalive to sessions idle for 'keepalive_interval' seconds, reconnects sessions
+    failing it, and replaces every session older than 'relogin_interval' seconds with a newly authenticated one
+    before the device expires it. Least recently used sessions are closed above 'max_size' entries, a holder of a
+closed session gets a new one for the same key with get().
+    """
+
+    _shared_pool = None
+    _shared_pool_lock = threading.Lock()
+
+    def __init__(self, max_size=16, keepalive_interval=60, relogin_interval=1800):
+        self._max_size = max_size or 16
+        self._keepalive_interval = keepalive_interval or 0
+        self._relogin_interval = relogin_interval or 0
+
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._maintenance_thread = None
+
+        self.created_count = 0
+        self.reuse_count = 0
+        self.evicted_count = 0
+        self.keepalive_failures = 0
+
+    @classmethod
+    def shared(cls, **settings):
+        with cls._shared_pool_lock:
+            if cls._shared_pool is None:
+                cls._shared_pool = cls(**settings)
+            return cls._shared_pool
+
+    def get(self, key, session_factory, login, keepalive):
+        """Get authenticated session for the key, open it if there is none
+
+        :return: (PooledSession, reused)
+        """
+
+        with self._lock:
+            pooled_session = self._sessions.pop(key, None)
+            if pooled_session is not None and pooled_session.is_connected():
+                self._sessions[key] = pooled_session
+                self.reuse_count += 1
+                return pooled_session, True
+
+            # a session the device has closed
+            evicted_sessions = [pooled_session] if pooled_session is not None else list()
+            pooled_session = PooledSession(key, session_factory, login, keepalive)
+            self._sessions[key] = pooled_session
+            while len(self._sessions) > self._max_size:
+                evicted_sessions.append(self._sessions.popitem(last=False)[1])
+                self.evicted_count += 1
+
+        for evicted_session in evicted_sessions:
+            evicted_session.close()
+
+        try:
+            pooled_session.open()
+        except Exception:
+            self.discard(key)
+            raise
+
+        self.created_count += 1
+        self._start_maintenance()
+        return pooled_session, False
+
+    def discard(self, key):
+        with self._lock:
+            pooled_session = self._sessions.pop(key, None)
+
+        if pooled_session is not None:
+            pooled_session.close()
+
+    def _start_maintenance(self):
+        if self._maintenance_thread is not None or not (self._keepalive_interval or self._relogin_interval):
+            return
+
+        self._maintenance_thread = threading.Thread(target=self._maintenance_loop, name='SessionPoolMaintenance')
+        self._maintenance_thread.daemon = True
+        self._maintenance_thread.start()
+
+    def _maintenance_loop(self):
+        check_interval = min(interval for interval in (self._keepalive_interval, self._relogin_interval)
+                             if interval) / 4.0
+        while True:
+            time.sleep(check_interval)
+            with self._lock:
+                pooled_sessions = self._sessions.values()
+
+            for pooled_session in pooled_sessions:
+                try:
+                    self._maintain(pooled_session)
+                except Exception:
+                    logging.getLogger(__name__).warning('Session maintenance failed', exc_info=True)
+
+    def _maintain(self, pooled_session):
+        if not pooled_session.is_connected():
+            if pooled_session.is_open():
+                # the device closed the connection
+                self.keepalive_failures += 1
+                pooled_session.reconnect()
+            return
+
+        now = time.time()
+        if self._relogin_interval and now - pooled_session.login_time > self._relogin_interval:
+            # the new session is authenticated before it replaces the current one
+            pooled_session.relogin()
+            return
+
+        if not self._keepalive_interval or now - pooled_session.last_used < self._keepalive_interval:
+            return
+
+        # never delay a request, skip a busy session
+        if not pooled_session.lock.acquire(False):
+            return
+        try:
+            keepalive_output = pooled_session.keepalive()
+        except Exception:
+            keepalive_output = ''
+        finally:
+            pooled_session.lock.release()
+
+        if not re.search(r'COMPLD', keepalive_output):
+            self.keepalive_failures += 1
+            pooled_session.reconnect()
+
+    def get_statistics(self):
+        with self._lock:
+            pooled_sessions = self._sessions.values()
+
+        return {
+            'size': len(pooled_sessions),
+            'max_size': self._max_size,
+            'created': self.created_count,
+            'reused': self.reuse_count,
+            'evicted': self.evicted_count,
+            'keepalive_failures': self.keepalive_failures,
+            'sessions': [{
+                'device': '{0}:{1}'.format(*pooled_session.key[:2]),
+                'uses': pooled_session.use_count,
+                'relogins': pooled_session.relogin_count,
+                'reconnects': pooled_session.reconnect_count,
+                'idle': time.time() - pooled_session.last_used,
+                'age': time.time() - pooled_session.login_time
+            } for pooled_session in pooled_sessions]
+        }
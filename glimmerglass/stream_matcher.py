@@ -0,0 +1,40 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import re
+
+
+class StreamMatcher(object):
+    """Accumulate received chunks and search patterns only in the newest chunk plus a bounded overlap
+
+    Chunks are kept in a list and joined once when the output is requested, so matching a response delivered
+    in many small reads costs time proportional to its size. A match has to end in the newest chunk and can't
+    start more than 'overlap' characters before it.
+    """
+
+    def __init__(self, overlap=1024):
+        self._overlap = overlap
+        self._patterns = dict()
+        self._chunks = list()
+        self._window = ''
+
+    def feed(self, data):
+        self._window = self._window[-self._overlap:] + data
+        self._chunks.append(data)
+
+    def search(self, pattern):
+        compiled_pattern = self._patterns.get(pattern)
+        if compiled_pattern is None:
+            compiled_pattern = self._patterns[pattern] = re.compile(pattern, re.DOTALL)
+
+        return compiled_pattern.search(self._window)
+
+    def getvalue(self):
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+
+        return self._chunks[0] if self._chunks else ''
+
+    def reset(self):
+        self._chunks = list()
+        self._window = ''
@@ -1,4 +1,6 @@
+import errno
 import re
+import select
 import socket
 import time
 from collections import OrderedDict
@@ -7,34 +9,121 @@ from common.cli.exceptions import SessionLoopLimitException, CommandExecutionExc
 from common.cli.expect_session import ActionLoopDetector
 from common.cli.helper.normalize_buffer import normalize_buffer
 from common.cli.tcp_session import TCPSession
+from glimmerglass.adaptive_timeouts import command_timeouts
+from glimmerglass.command_statistics import statistics, command_type
+from glimmerglass.stream_matcher import StreamMatcher
+from glimmerglass.tl1_pipeline import TL1ResponseDemultiplexer, command_ctag, drop_stale_responses
 
 
 class GGTCPSession(TCPSession):
+    # how far back from the newest received chunk expected patterns are searched
+    _match_overlap = 1024
+    # default seconds to wait for the expected prompt of a command
+    _command_timeout = 120
+    # default seconds to wait for each response of pipelined commands
+    _pipeline_timeout = 120
+    # receive timeout once the socket is readable, recv returns without waiting then
+    _ready_read_timeout = 1
+
     def __init__(self, *args, **kwargs):
         super(GGTCPSession, self).__init__(*args, **kwargs)
         self._login_prompt = None
+        # device address learned command timeouts are kept for
+        self._device = None
 
     def connect(self, host, username, password, command=None, error_map=None, action_map=None, port=None, re_string=''):
         self._login_prompt = re_string
+        self._device = host if port is None else '{0}:{1}'.format(host, port)
         return super(GGTCPSession, self).connect(host, username, password, command, error_map, action_map, port, re_string)
 
     def reconnect(self, re_string=''):
         return super(GGTCPSession, self).reconnect(self._login_prompt)
 
+    def _wait_readable(self, timeout):
+        """Wait up to timeout seconds for data from the device
+
+        :return: True if the socket is readable
+        """
+
+        try:
+            if hasattr(select, 'poll'):
+                poller = select.poll()
+                poller.register(self._handler, select.POLLIN | select.POLLPRI)
+                return len(poller.poll(max(timeout, 0) * 1000)) > 0
+            # no poll on Windows
+            return len(select.select([self._handler], [], [], max(timeout, 0))[0]) > 0
+        except select.error as error:
+            if error.args[0] == errno.EINTR:
+                return False
+            raise
+
+    def _read_ready(self):
+        """Read data the socket reported as readable
+
+        :raise SessionLoopLimitException: device closed the connection
+        """
+
+        read_buffer = self._receive(self._ready_read_timeout)
+        if not read_buffer:
+            raise SessionLoopLimitException(self.__class__.__name__, 'Connection closed by device')
+        return read_buffer
+
+    def _drain_buffer(self):
+        """Read whatever the device has already sent, return as soon as the socket is idle"""
+
+        output_list = list()
+        while self._wait_readable(0):
+            try:
+                output_list.append(self._read_ready())
+            except (socket.timeout, SessionLoopLimitException):
+                break
+        return ''.join(output_list)
+
+    def is_alive(self):
+        """False once the device has closed the connection, data waiting to be read is left in place"""
+
+        if self._handler is None:
+            return False
+        try:
+            if not self._wait_readable(0):
+                return True
+            self._handler.settimeout(self._ready_read_timeout)
+            return len(self._handler.recv(1, socket.MSG_PEEK)) > 0
+        except socket.timeout:
+            return True
+        except (socket.error, select.error):
+            return False
+
+    def receive_unsolicited(self, timeout):
+        """Wait up to timeout seconds for data the device sends on its own, like TL1 autonomous messages
+
+        :return: received data, '' if nothing came
+        :raise SessionLoopLimitException: device closed the connection
+        """
+
+        if not self._wait_readable(timeout):
+            return ''
+        try:
+            return self._read_ready()
+        except socket.timeout:
+            return ''
+
     def hardware_expect(self, data_str=None, re_string='', expect_map=None, error_map=None,
                         timeout=None, retries=None, check_action_loop_detector=True, empty_loop_timeout=None,
                         **optional_args):
 
         """Get response form the device and compare it to expected_map, error_map and re_string patterns,
         perform actions specified in expected_map if any, and return output.
-        Raise Exception if receive empty responce from device within a minute
+        Raise Exception if no expected prompt is received before the command deadline
 
         :param data_str: command to send
         :param re_string: expected string
         :param expect_map: dict with {re_str: action} to trigger some action on received string
         :param error_map: expected error list
-        :param timeout: session timeout
-        :param retries: maximal retries count
+        :param timeout: seconds to wait for the expected string, counted from sending the command, learned from
+            previous responses of the command by default
+        :param retries: unused, the wait is limited by timeout
+        :param empty_loop_timeout: unused, reads wait for socket readiness
         :return:
         """
 
@@ -44,50 +133,65 @@ class GGTCPSession(TCPSession):
         if not error_map:
             error_map = OrderedDict()
 
-        retries = retries or self._max_loop_retries
-        empty_loop_timeout = empty_loop_timeout or self._empty_loop_timeout
+        if not timeout and data_str is not None:
+            timeout = command_timeouts.timeout(self._device, data_str, self._command_timeout)
+        timeout = timeout or self._command_timeout
+        ctag = command_ctag(data_str) if data_str is not None else None
+        timer = None
 
         if data_str is not None:
-            self._clear_buffer(self._clear_buffer_timeout)
+            if statistics.enabled:
+                timer = statistics.timer('tl1.' + command_type(data_str))
+            self._drain_buffer()
+            if timer is not None:
+                timer.mark('clear_buffer')
 
             self.logger.info('Command: {}'.format(data_str.replace(self._password, "*" * 7)))
             self.send_line(data_str)
+        send_time = time.time()
 
         if re_string is None or len(re_string) == 0:
             raise Exception('ExpectSession', 'List of expected messages can\'t be empty!')
 
-        # Loop until one of the expressions is matched or MAX_RETRIES
-        # nothing is expected (usually used for exit)
+        # Loop until one of the expressions is matched or the deadline passes
         output_list = list()
-        output_str = ''
-        retries_count = 0
+        output_matcher = StreamMatcher(self._match_overlap)
+        deadline = time.time() + timeout
         is_correct_exit = False
         action_loop_detector = ActionLoopDetector(self._loop_detector_max_action_loops,
                                                   self._loop_detector_max_combination_length)
 
-        while retries == 0 or retries_count < retries:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self._wait_readable(remaining):
+                if time.time() < deadline:
+                    continue
+                break
 
             try:
-                read_buffer = self._receive(timeout)
+                read_buffer = self._read_ready()
             except socket.timeout:
-                read_buffer = None
-
-            if read_buffer:
-                output_str += read_buffer
-                retries_count = 0
-            else:
-                retries_count += 1
-                time.sleep(empty_loop_timeout)
                 continue
 
-            if re.search(re_string, output_str, re.DOTALL):
-                output_list.append(output_str)
-                is_correct_exit = True
+            if timer is not None:
+                timer.mark('socket_wait')
+
+            output_matcher.feed(read_buffer)
+
+            if output_matcher.search(re_string):
+                # a response to an earlier command which timed out may come first
+                is_correct_exit, output = drop_stale_responses(output_matcher.getvalue(), re_string, ctag)
+                if is_correct_exit:
+                    output_list.append(output)
+                else:
+                    self.logger.debug('Dropped late response to an earlier command')
+                    output_matcher.reset()
+                    output_matcher.feed(output)
 
             for expect_string in expect_map:
-                result_match = re.search(expect_string, output_str, re.DOTALL)
+                result_match = output_matcher.search(expect_string)
                 if result_match:
-                    output_list.append(output_str)
+                    output_list.append(output_matcher.getvalue())
 
                     if check_action_loop_detector:
                         if action_loop_detector.loops_detected(expect_string):
@@ -95,16 +199,21 @@ class GGTCPSession(TCPSession):
                             raise SessionLoopDetectorException(self.__class__.__name__,
                                                                'Expected actions loops detected')
                     expect_map[expect_string](self)
-                    output_str = ''
+                    output_matcher.reset()
                     break
 
+            if timer is not None:
+                timer.mark('matching')
+
             if is_correct_exit:
                 break
 
         if not is_correct_exit:
-            self.logger.debug("Received output: {}".format("".join(output_list)))
+            if data_str is not None:
+                command_timeouts.observe_timeout(self._device, data_str)
+            self.logger.debug("Received output: {}".format("".join(output_list) + output_matcher.getvalue()))
             raise SessionLoopLimitException(self.__class__.__name__,
-                                            'Session Loop limit exceeded, {} loops'.format(retries_count))
+                                            'No expected prompt in {} seconds'.format(timeout))
 
         result_output = ''.join(output_list)
 
@@ -115,9 +224,75 @@ class GGTCPSession(TCPSession):
                 raise CommandExecutionException('ExpectSession',
                                                 'Session returned \'{}\''.format(error_map[error_string]))
 
-        # Read buffer to the end. Useful when re_string isn't last in buffer
-        result_output += self._clear_buffer(self._clear_buffer_timeout)
+        # Read data already received after the expected string, useful when re_string isn't last in buffer
+        result_output += self._drain_buffer()
+        if timer is not None:
+            timer.mark('clear_buffer')
 
         result_output = normalize_buffer(result_output)
+        if data_str is not None:
+            command_timeouts.observe(self._device, data_str, time.time() - send_time, len(result_output))
         self.logger.info(result_output.replace(self._password, "*" * 7))
+        if timer is not None:
+            timer.mark('logging')
+            timer.finish(len(result_output))
         return result_output
+
+    def send_pipelined(self, commands, timeout=None):
+        """Send TL1 commands back to back and route responses to them by CTAG
+
+        :param commands: list of (ctag, command) or (ctag, command, timeout) tuples
+        :param timeout: seconds to wait for each response, counted from sending the command, learned from previous
+            responses of each command by default
+        :return: list of responses in the order of commands
+        """
+
+        self._drain_buffer()
+
+        deadlines = dict()
+        send_times = dict()
+        timers = dict()
+        for command_data in commands:
+            ctag, command = str(command_data[0]), command_data[1]
+            self.logger.info('Command: {}'.format(command.replace(self._password, "*" * 7)))
+            self.send_line(command)
+            send_times[ctag] = time.time()
+            if len(command_data) > 2:
+                deadlines[ctag] = send_times[ctag] + command_data[2]
+            else:
+                deadlines[ctag] = send_times[ctag] + (timeout or command_timeouts.timeout(self._device, command,
+                                                                                         self._pipeline_timeout))
+            if statistics.enabled:
+                timers[ctag] = statistics.timer('tl1.' + command_type(command))
+
+        commands_by_ctag = dict((str(command_data[0]), command_data[1]) for command_data in commands)
+        demultiplexer = TL1ResponseDemultiplexer(deadlines.keys())
+        responses = dict()
+        while demultiplexer.pending:
+            now = time.time()
+            timed_out = [pending_ctag for pending_ctag in demultiplexer.pending if deadlines[pending_ctag] <= now]
+            if timed_out:
+                for ctag in timed_out:
+                    command_timeouts.observe_timeout(self._device, commands_by_ctag[ctag])
+                self.logger.debug("Received output: {}".format(demultiplexer.remainder()))
+                raise SessionLoopLimitException(self.__class__.__name__,
+                                                'No response for ctag {}'.format(', '.join(sorted(timed_out))))
+
+            if not self._wait_readable(min(deadlines[pending_ctag] for pending_ctag in demultiplexer.pending) - now):
+                continue
+
+            try:
+                read_buffer = self._read_ready()
+            except socket.timeout:
+                continue
+
+            for ctag, status, response in demultiplexer.feed(read_buffer):
+                response = normalize_buffer(response)
+                command_timeouts.observe(self._device, commands_by_ctag[ctag], time.time() - send_times[ctag],
+                                         len(response))
+                self.logger.info(response.replace(self._password, "*" * 7))
+                responses[ctag] = response
+                if ctag in timers:
+                    timers[ctag].finish(len(response))
+
+        return [responses[str(command_data[0])] for command_data in commands]
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import re
+from collections import namedtuple
+
+from glimmerglass import tl1_parser
+
+AutonomousMessage = namedtuple('AutonomousMessage', ['alarm_code', 'atag', 'verb', 'text'])
+
+_MESSAGE_HEADER_RE = re.compile(r"^[ \t]*(?P<alarm_code>\*C|\*\*|\*|A)[ \t]+(?P<atag>\S+)[ \t]+REPT[ \t]+" +
+                                r"(?P<verb>[^\r\n]*)\r?\n", re.MULTILINE)
+_MESSAGE_TERMINATOR_RE = re.compile(r"^[ \t]*;", re.MULTILINE)
+_DELETE_RE = re.compile(r"DLT|DELETE|DISCONN", re.IGNORECASE)
+_DELETE_COMMAND_RE = re.compile(r"DLT-CRS", re.IGNORECASE)
+# cross-connect lines, cross-connect command echoes and port health lines
+_TOPOLOGY_RE = re.compile(r"[IO]PORTID=|CRS-FIBER|PORTHEALTH=", re.IGNORECASE)
+
+
+class AutonomousMessageReader(object):
+    """Cut TL1 autonomous messages ('REPT ...' blocks) out of a stream of device output"""
+
+    # longest incomplete message kept, a device never sends one that long
+    _max_message_size = 65536
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, data):
+        """Add received data
+
+        :param data: received chunk
+        :return: list of AutonomousMessage completed by this chunk
+        """
+
+        buffer_str = self._buffer + data
+        messages = list()
+        position = 0
+        while True:
+            header_match = _MESSAGE_HEADER_RE.search(buffer_str, position)
+            if header_match is None:
+                # the last line may be the beginning of a header
+                position = max(buffer_str.rfind('\n') + 1, position)
+                break
+
+            terminator_match = _MESSAGE_TERMINATOR_RE.search(buffer_str, header_match.end())
+            if terminator_match is None:
+                position = header_match.start()
+                break
+
+            messages.append(AutonomousMessage(text=buffer_str[header_match.start():terminator_match.end()],
+                                              **header_match.groupdict()))
+            position = terminator_match.end()
+
+        self._buffer = buffer_str[position:][-self._max_message_size:]
+        return messages
+
+
+def apply_message(topology, message):
+    """Apply cross-connect and port health changes reported by an autonomous message
+
+    Cross-connect lines are shaped like 'rtrv-crs-fiber' output and get removed when the message verb or a
+    'DLT-CRS-FIBER' echo reports a deletion, port lines are shaped like 'RTRV-CFG-FIBER' output.
+
+    :param topology: DeviceTopology
+    :param message: AutonomousMessage
+    :return: True if applied, False if it reports cross-connect or port changes which can't be applied, None if it
+        reports nothing of the topology, like alarms, temperature or session events
+    """
+
+    if _TOPOLOGY_RE.search(message.text) is None:
+        return None
+
+    connections = tl1_parser.parse_connections(message.text, allow_unnamed_ports=True)
+    ports = tl1_parser.parse_ports(message.text)
+    if not connections and not ports:
+        return False
+
+    delete = _DELETE_RE.search(message.verb) is not None or _DELETE_COMMAND_RE.search(message.text) is not None
+    for connection in connections:
+        if delete:
+            topology.disconnect(connection.src_port)
+        else:
+            topology.connect(connection.src_port, connection.dst_port)
+
+    applied = True
+    for port in ports:
+        applied = topology.set_health(port.id, port.health == 'good') and applied
+    return applied
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import re
+from collections import namedtuple
+
+PortRecord = namedtuple('PortRecord', ['id', 'name', 'direction', 'number', 'health'])
+CrossConnectRecord = namedtuple('CrossConnectRecord', ['src_port', 'src_port_name', 'dst_port', 'dst_port_name'])
+SystemInfo = namedtuple('SystemInfo', ['serial', 'type', 'vendor', 'model', 'version'])
+
+_SWITCH_SIZE_RE = re.compile(r"LicensedPortMatrix=(?P<src>\d+)x(?P<dst>\d+)")
+_SYSTEM_INFO_RE = re.compile(r'SerialNumber=(?P<serial>\S+)".*SystemType=(?P<type>\S+)".*"(?P<vendor>\S+):' +
+                             r'ChassisType=(?P<model>\S+)".*SoftwareActiveVersion=(?P<version>\S+)"', re.DOTALL)
+
+# every pattern below is anchored to the beginning of a line and can't cross it, so a single finditer
+# over the whole response gives the same matches as a re.search on each line of the split response
+_PORT_RE = re.compile(r"^[^\n]*?PORTID=(?P<id>\d+)[^\n]*PORTNAME=(?P<name>(?P<direction>IN|OUT)(?P<number>\d+))" +
+                      r"[^\n]*PORTHEALTH=(?P<health>good|bad)", re.MULTILINE)
+_CONNECTION_RE = re.compile(r"^[^\n]*?IPORTID=(?P<src_port>\d+)[^\n]*IPORTNAME=(?P<src_port_name>\S+),IP[^\n]*" +
+                            r"OPORTID=(?P<dst_port>\d+)[^\n]*OPORTNAME=(?P<dst_port_name>\S+),OP", re.MULTILINE)
+_UNNAMED_CONNECTION_RE = re.compile(r"^[^\n]*IPORTID=(?P<src_port>\d+)[^\n]*IPORTNAME=(?P<src_port_name>\S*),IP" +
+                                    r"[^\n]*OPORTID=(?P<dst_port>\d+)[^\n]*OPORTNAME=(?P<dst_port_name>\S*),OP",
+                                    re.MULTILINE)
+_PORT_DIRECTION_RE = re.compile(r"IN|OUT")
+
+
+def parse_switch_size(response):
+    """Get licensed matrix size from 'rtrv-system-info' response
+
+    :param response: device output
+    :return: (src, dst) tuple of ints or None
+    """
+
+    size_match = _SWITCH_SIZE_RE.search(response)
+    if size_match is None:
+        return None
+
+    return int(size_match.group('src')), int(size_match.group('dst'))
+
+
+def parse_system_info(response):
+    """Get chassis details from 'rtrv-system-info' response
+
+    :param response: device output
+    :return: SystemInfo or None
+    """
+
+    model_info_match = _SYSTEM_INFO_RE.search(response)
+    if model_info_match is None:
+        return None
+
+    return SystemInfo(**model_info_match.groupdict())
+
+
+def parse_ports(response):
+    """Get port list from 'RTRV-CFG-FIBER' response
+
+    :param response: device output
+    :return: list of PortRecord, in device order
+    """
+
+    return [PortRecord(*match.group('id', 'name', 'direction', 'number', 'health'))
+            for match in _PORT_RE.finditer(response)]
+
+
+def parse_connections(response, allow_unnamed_ports=False):
+    """Get cross-connect list from 'rtrv-crs-fiber' response
+
+    :param response: device output
+    :param allow_unnamed_ports: accept connections with empty IPORTNAME/OPORTNAME
+    :return: list of CrossConnectRecord, in device order
+    """
+
+    pattern = _UNNAMED_CONNECTION_RE if allow_unnamed_ports else _CONNECTION_RE
+    return [CrossConnectRecord(*match.group('src_port', 'src_port_name', 'dst_port', 'dst_port_name'))
+            for match in pattern.finditer(response)]
+
+
+def logical_port_id(port_name):
+    """Strip IN/OUT direction from port name, 'IN12' -> '12'"""
+
+    return _PORT_DIRECTION_RE.sub('', port_name)
+
+
+def format_aids(aids):
+    """Join AIDs into a TL1 AID list, runs of 3 and more consecutive AIDs as 'first&&last'
+
+    [10001, 10002, 10003, 20007] -> '10001&&10003&20007'
+    """
+
+    aids = sorted(set(int(aid) for aid in aids))
+    items = list()
+    start = 0
+    for index in range(1, len(aids) + 1):
+        if index == len(aids) or aids[index] != aids[index - 1] + 1:
+            if index - start >= 3:
+                items.append('{0}&&{1}'.format(aids[start], aids[index - 1]))
+            else:
+                items.extend(str(aid) for aid in aids[start:index])
+            start = index
+    return '&'.join(items)
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import re
+
+_RESPONSE_HEADER_RE = re.compile(r"^[ \t]*M[ \t]+(?P<ctag>\S+)[ \t]+(?P<status>COMPLD|DENY|PRTL|DELAY|RTRV)",
+                                 re.MULTILINE)
+_RESPONSE_TERMINATOR_RE = re.compile(r"^[ \t]*(?P<terminator>[;>])", re.MULTILINE)
+
+
+class TL1ResponseDemultiplexer(object):
+    """Split a stream of TL1 responses to commands sent back to back and route them by CTAG
+
+    Response blocks are cut at the ';' terminator, blocks ending with '>' are partial and get joined with the
+    rest of the response. Everything received between two responses (SID/date line, prompt) belongs to the
+    next one, so the joined responses contain all received data. Only the newest chunk plus a short overlap is
+    scanned on each read, positions below are offsets in the whole received stream.
+    """
+
+    _overlap = 256
+
+    def __init__(self, ctags):
+        self._pending = set(str(ctag) for ctag in ctags)
+        self._partial = dict()
+
+        self._chunks = list()
+        self._chunks_offset = 0
+        self._received = 0
+        self._window = ''
+
+        self._block_start = 0
+        self._header_match = None
+        self._body_start = None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def feed(self, data):
+        """Add received data
+
+        :param data: received chunk
+        :return: list of (ctag, status, response) completed by this chunk
+        """
+
+        window = self._window[-self._overlap:] + data
+        window_offset = self._received - (len(window) - len(data))
+        self._chunks.append(data)
+        self._received += len(data)
+        self._window = window
+
+        completed = list()
+        while True:
+            if self._header_match is None:
+                self._header_match = _RESPONSE_HEADER_RE.search(window, max(self._block_start - window_offset, 0))
+                if self._header_match is None:
+                    break
+                self._body_start = window_offset + self._header_match.end()
+
+            terminator_match = _RESPONSE_TERMINATOR_RE.search(window, max(self._body_start - window_offset, 0))
+            if terminator_match is None:
+                break
+
+            block = self._cut(window_offset + terminator_match.end())
+            ctag, status = self._header_match.group('ctag', 'status')
+            self._header_match = None
+
+            if terminator_match.group('terminator') == '>':
+                self._partial.setdefault(ctag, list()).append(block)
+                continue
+
+            response = ''.join(self._partial.pop(ctag, list())) + block
+            if ctag in self._pending:
+                self._pending.discard(ctag)
+                completed.append((ctag, status, response))
+
+        return completed
+
+    def _cut(self, block_end):
+        received = ''.join(self._chunks)
+        block = received[self._block_start - self._chunks_offset:block_end - self._chunks_offset]
+        self._chunks = [received[block_end - self._chunks_offset:]]
+        self._chunks_offset = block_end
+        self._block_start = block_end
+        return block
+
+    def remainder(self):
+        """Data received after the last complete response"""
+
+        return ''.join(self._chunks)
+
+
+def command_ctag(command):
+    """CTAG of a TL1 command, 'rtrv-crs-fiber::all:5;' -> '5', None if the command has none"""
+
+    fields = command.strip().rstrip(';').split(':')
+    if len(fields) > 3 and fields[3].strip():
+        return fields[3].strip()
+    return None
+
+
+def drop_stale_responses(output, prompt, ctag):
+    """Cut responses to earlier commands, which came after they timed out, from the beginning of output
+
+    :param output: received data, prompt found in it
+    :param prompt: expected prompt pattern
+    :param ctag: CTAG of the command waiting for its response, None accepts any response
+    :return: (True, output) if output holds the response to the command, (False, data after the last stale
+        response) otherwise
+    """
+
+    if ctag is None:
+        return True, output
+
+    prompt_match = re.search(prompt, output, re.DOTALL)
+    while prompt_match is not None:
+        ctags = [match.group('ctag') for match in _RESPONSE_HEADER_RE.finditer(output, 0, prompt_match.end())]
+        if not ctags or ctag in ctags:
+            return True, output
+        output = output[prompt_match.end():]
+        prompt_match = re.search(prompt, output, re.DOTALL)
+    return False, output
@@ -0,0 +1,250 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from array import array
+
+IN = 'IN'
+OUT = 'OUT'
+
+# AIDs of logical port N when the device port list doesn't say otherwise
+IN_PORT_BASE = 10000
+OUT_PORT_BASE = 20000
+
+# (table, array typecode) saved by DeviceTopology.to_snapshot()
+SNAPSHOT_TABLES = (('in_aid', 'i'), ('out_aid', 'i'), ('in_health', 'b'), ('out_health', 'b'), ('source_of', 'i'),
+                   ('target_of', 'i'), ('port_aids', 'i'))
+
+
+class DeviceTopology(object):
+    """Chassis state in flat tables indexed by logical port number
+
+    in_aid/out_aid hold the AID of the IN/OUT port of each number and in_health/out_health whether it is good.
+    source_of holds the IN AID feeding each OUT port and target_of the OUT AID each IN port feeds. AID 0 means there
+    is no such port or cross-connect. A topology is built in full from device data and replaces the previous one,
+    only connect/disconnect/set_health change it afterwards.
+    """
+
+    def __init__(self, system_info, switch_size, ports, connections):
+        """
+        :param system_info: tl1_parser.SystemInfo
+        :param switch_size: licensed port count
+        :param ports: list of tl1_parser.PortRecord, in device order
+        :param connections: list of tl1_parser.CrossConnectRecord
+        """
+
+        self.system_info = system_info
+        self.switch_size = switch_size
+
+        size = max([int(port.number) for port in ports] or [0]) + 1
+        self.in_aid = array('i', [0]) * size
+        self.out_aid = array('i', [0]) * size
+        self.in_health = array('b', [0]) * size
+        self.out_health = array('b', [0]) * size
+        self.source_of = array('i', [0]) * size
+        self.target_of = array('i', [0]) * size
+        # AIDs in device order
+        self.port_aids = array('i')
+        # AID -> (direction, logical port number)
+        self._ports = dict()
+        # an IN port feeds more than one OUT port
+        self._fan_out = False
+
+        for port in ports:
+            aid = int(port.id)
+            number = int(port.number)
+            if port.direction == IN:
+                self.in_aid[number] = aid
+                self.in_health[number] = port.health == 'good'
+            else:
+                self.out_aid[number] = aid
+                self.out_health[number] = port.health == 'good'
+            self.port_aids.append(aid)
+            self._ports[aid] = (port.direction, number)
+
+        for connection in connections:
+            src_aid = int(connection.src_port)
+            dst_aid = int(connection.dst_port)
+            if src_aid > 0 and dst_aid > 0:
+                self._set_connection(src_aid, dst_aid)
+
+    def to_snapshot(self):
+        """Copy of the topology state as plain values, cheap enough to take after every change
+
+        :return: dict with system_info, switch_size, fan_out and the raw bytes of each table
+        """
+
+        snapshot = dict((name, getattr(self, name).tostring()) for name, _ in SNAPSHOT_TABLES)
+        snapshot['system_info'] = list(self.system_info) if self.system_info is not None else None
+        snapshot['switch_size'] = self.switch_size
+        snapshot['fan_out'] = self._fan_out
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, snapshot, system_info_class):
+        """Rebuild a topology from to_snapshot() output
+
+        :param system_info_class: tl1_parser.SystemInfo
+        """
+
+        system_info = system_info_class(*snapshot['system_info']) if snapshot['system_info'] is not None else None
+        topology = cls(system_info, snapshot['switch_size'], list(), list())
+        for name, typecode in SNAPSHOT_TABLES:
+            table = array(typecode)
+            table.fromstring(snapshot[name])
+            setattr(topology, name, table)
+        topology._fan_out = snapshot['fan_out']
+
+        for number, aid in enumerate(topology.in_aid):
+            if aid:
+                topology._ports[aid] = (IN, number)
+        for number, aid in enumerate(topology.out_aid):
+            if aid:
+                topology._ports[aid] = (OUT, number)
+        return topology
+
+    @property
+    def port_count(self):
+        return len(self.in_aid) - 1
+
+    def port(self, aid):
+        """(direction, logical port number) of the AID, None for unknown ports"""
+
+        return self._ports.get(int(aid))
+
+    def is_good(self, aid):
+        direction, number = self._ports[int(aid)]
+        return bool((self.in_health if direction == IN else self.out_health)[number])
+
+    def set_health(self, aid, good):
+        """Apply a port health change, unknown ports are ignored
+
+        :return: True if the port is known
+        """
+
+        port = self._ports.get(int(aid))
+        if port is None:
+            return False
+
+        (self.in_health if port[0] == IN else self.out_health)[port[1]] = bool(good)
+        return True
+
+    def in_port_aid(self, number):
+        """AID of IN port of the logical port number"""
+
+        number = int(number)
+        if 0 < number < len(self.in_aid) and self.in_aid[number]:
+            return self.in_aid[number]
+        return IN_PORT_BASE + number
+
+    def out_port_aid(self, number):
+        """AID of OUT port of the logical port number"""
+
+        number = int(number)
+        if 0 < number < len(self.out_aid) and self.out_aid[number]:
+            return self.out_aid[number]
+        return OUT_PORT_BASE + number
+
+    def source(self, out_aid):
+        """IN AID feeding the OUT port, 0 if it isn't connected"""
+
+        port = self._ports.get(int(out_aid))
+        return self.source_of[port[1]] if port is not None and port[0] == OUT else 0
+
+    def target(self, in_aid):
+        """OUT AID fed by the IN port, 0 if it isn't connected"""
+
+        port = self._ports.get(int(in_aid))
+        return self.target_of[port[1]] if port is not None and port[0] == IN else 0
+
+    @property
+    def connections(self):
+        """(IN AID, OUT AID) of each cross-connect of known OUT ports, by OUT port number"""
+
+        return [(src_aid, self.out_aid[number]) for number, src_aid in enumerate(self.source_of) if src_aid]
+
+    def merge(self, ports, connections, aids):
+        """Apply a partial retrieval of the AIDs to the topology
+
+        :param ports: list of tl1_parser.PortRecord of the AIDs
+        :param connections: list of tl1_parser.CrossConnectRecord with either end in the AIDs, these replace every
+            cross-connect of the AIDs
+        :param aids: retrieved AIDs
+        :return: False if the device reported a port the topology doesn't know, the topology is left as it was
+        """
+
+        if any(int(port.id) not in self._ports for port in ports):
+            return False
+
+        for port in ports:
+            self.set_health(port.id, port.health == 'good')
+
+        for aid in aids:
+            port = self._ports.get(int(aid))
+            if port is None:
+                continue
+            if port[0] == IN:
+                self.disconnect(aid)
+            elif self.source_of[port[1]]:
+                self._clear_source(port[1])
+
+        for connection in connections:
+            src_aid = int(connection.src_port)
+            dst_aid = int(connection.dst_port)
+            if src_aid > 0 and dst_aid > 0:
+                self._set_connection(src_aid, dst_aid)
+        return True
+
+    def _clear_source(self, number):
+        """Remove the cross-connect feeding OUT port of the logical port number"""
+
+        dst_aid = self.out_aid[number]
+        src_port = self._ports.get(self.source_of[number])
+        if src_port is not None and src_port[0] == IN and self.target_of[src_port[1]] == dst_aid:
+            self.target_of[src_port[1]] = 0
+        self.source_of[number] = 0
+
+    def _set_connection(self, src_aid, dst_aid):
+        src_port = self._ports.get(src_aid)
+        dst_port = self._ports.get(dst_aid)
+
+        if dst_port is not None and dst_port[0] == OUT:
+            previous_src_aid = self.source_of[dst_port[1]]
+            if previous_src_aid and previous_src_aid != src_aid:
+                previous_src_port = self._ports.get(previous_src_aid)
+                if previous_src_port is not None and self.target_of[previous_src_port[1]] == dst_aid:
+                    self.target_of[previous_src_port[1]] = 0
+            self.source_of[dst_port[1]] = src_aid
+
+        if src_port is not None and src_port[0] == IN:
+            if self.target_of[src_port[1]] and self.target_of[src_port[1]] != dst_aid:
+                self._fan_out = True
+            self.target_of[src_port[1]] = dst_aid
+
+    def connect(self, src_aid, dst_aid):
+        """Apply successful 'ent-crs-fiber' to the topology
+
+        :param src_aid: IN port AID
+        :param dst_aid: OUT port AID
+        """
+
+        self.disconnect(src_aid)
+        self._set_connection(int(src_aid), int(dst_aid))
+
+    def disconnect(self, src_aid):
+        """Apply successful 'dlt-crs-fiber' to the topology
+
+        :param src_aid: IN port AID
+        """
+
+        src_aid = int(src_aid)
+        src_port = self._ports.get(src_aid)
+        if src_port is not None and src_port[0] == IN:
+            dst_port = self._ports.get(self.target_of[src_port[1]])
+            if dst_port is not None and dst_port[0] == OUT and self.source_of[dst_port[1]] == src_aid:
+                self.source_of[dst_port[1]] = 0
+            self.target_of[src_port[1]] = 0
+
+        if self._fan_out:
+            for number, aid in enumerate(self.source_of):
+                if aid == src_aid:
+                    self.source_of[number] = 0
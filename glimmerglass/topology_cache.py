@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class TopologyCache(object):
+    """Keep last DeviceTopology for 'ttl' seconds, ttl of 0 disables the cache
+
+    A live cache, kept up to date by an autonomous message listener, serves its topology regardless of age, so does
+    a stale one, holding a topology loaded from a snapshot until it is retrieved from the device again.
+    on_change(topology) is called whenever a topology is put into the cache or changed in place.
+
+    The cached topology is shared by request workers and the autonomous message listener, 'lock' is held by whoever
+    reads it or changes it in place, cache methods take it themselves.
+    """
+
+    def __init__(self, ttl=0):
+        self._ttl = ttl or 0
+        self._lock = threading.RLock()
+        self._topology = None
+        self._timestamp = 0
+        self._live = False
+        self._stale = False
+        # incremented on every put and in place change
+        self.generation = 0
+        self.on_change = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def lock(self):
+        return self._lock
+
+    @property
+    def topology(self):
+        """Cached topology regardless of its age, used for write-through updates"""
+
+        return self._topology
+
+    def get(self):
+        with self._lock:
+            if self._topology is not None and (self._live or self._stale or
+                                               time.time() - self._timestamp < self._ttl):
+                self.hits += 1
+                return self._topology
+
+            self.misses += 1
+            return None
+
+    def put(self, topology, stale=False, timestamp=None):
+        """
+        :param stale: topology doesn't come from the device, it is served until the next put
+        :param timestamp: time the topology was retrieved, now by default
+        """
+
+        with self._lock:
+            self._topology = topology
+            self._timestamp = timestamp or time.time()
+            self._stale = stale
+            self.generation += 1
+            if not stale and self.on_change is not None:
+                self.on_change(topology)
+
+    def touch(self):
+        """Report an in place change of the cached topology, made with 'lock' held"""
+
+        with self._lock:
+            self.generation += 1
+            if self._topology is not None and self.on_change is not None:
+                self.on_change(self._topology)
+
+    @property
+    def stale(self):
+        return self._stale and self._topology is not None
+
+    @property
+    def live(self):
+        return self._live
+
+    def set_live(self, live):
+        self._live = live
+
+    def invalidate(self):
+        with self._lock:
+            self._topology = None
+            self._timestamp = 0
+            self._stale = False
+
+    def get_statistics(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'ttl': self._ttl,
+                'live': self._live,
+                'stale': self.stale,
+                'age': time.time() - self._timestamp if self._topology is not None else None
+            }
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+
+from glimmerglass import tl1_parser
+from glimmerglass.file_helper import write_file_atomically
+from glimmerglass.topology import DeviceTopology, SNAPSHOT_TABLES
+
+SNAPSHOT_VERSION = 1
+
+
+class TopologySnapshotStore(object):
+    """Last topology of each device in a file of its own, so a restarted driver can answer before the device does
+
+    A file holds a JSON header and the topology tables as base64 of their raw bytes. Files of another version or
+    written on a machine with another byte order or item sizes are ignored. save() only takes a copy of the tables,
+    a writer thread writes the last copy of each device, so saving after every change costs a few array copies.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._folder = None
+
+        self._condition = threading.Condition()
+        # device key -> (snapshot, saved time) waiting to be written
+        self._pending = dict()
+        self._writer = None
+
+        self.saved_count = 0
+        self.written_count = 0
+        self.loaded_count = 0
+
+    def configure(self, enabled=False, folder=None):
+        """
+        :param enabled: save and load snapshots
+        :param folder: folder for the snapshot files, created if missing
+        """
+
+        self.enabled = bool(enabled and folder)
+        self._folder = folder
+        if self.enabled and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def _file_path(self, key):
+        return os.path.join(self._folder, 'topology_{0}.json'.format(re.sub(r'[^\w.-]', '_', str(key))))
+
+    def save(self, key, topology):
+        """Schedule writing the topology of the device
+
+        :param key: device key, address
+        :param topology: DeviceTopology
+        """
+
+        if not self.enabled or topology is None:
+            return
+
+        snapshot = topology.to_snapshot()
+        with self._condition:
+            self._pending[key] = (snapshot, time.time())
+            self.saved_count += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='TopologySnapshotWriter')
+                self._writer.daemon = True
+                self._writer.start()
+            self._condition.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                key, (snapshot, saved_time) = self._pending.popitem()
+
+            try:
+                self.write(key, snapshot, saved_time)
+            except Exception:
+                logging.getLogger(__name__).warning('Failed to write topology snapshot of {0}'.format(key),
+                                                    exc_info=True)
+
+    def write(self, key, snapshot, saved_time=None):
+        """Write DeviceTopology.to_snapshot() output of the device, replacing the previous file at once"""
+
+        content = {
+            'version': SNAPSHOT_VERSION,
+            'byteorder': sys.byteorder,
+            'time': saved_time or time.time(),
+            'system_info': snapshot['system_info'],
+            'switch_size': snapshot['switch_size'],
+            'fan_out': snapshot['fan_out'],
+            'tables': dict((name, [array(typecode).itemsize, base64.b64encode(snapshot[name])])
+                           for name, typecode in SNAPSHOT_TABLES)
+        }
+
+        write_file_atomically(self._file_path(key),
+                              lambda snapshot_file: json.dump(content, snapshot_file, separators=(',', ':')))
+        self.written_count += 1
+
+    def load(self, key):
+        """Last saved topology of the device
+
+        :return: (DeviceTopology, saved time), (None, None) if there is no usable snapshot
+        """
+
+        if not self.enabled:
+            return None, None
+
+        file_path = self._file_path(key)
+        if not os.path.exists(file_path):
+            return None, None
+
+        try:
+            with open(file_path) as snapshot_file:
+                content = json.load(snapshot_file)
+
+            if content.get('version') != SNAPSHOT_VERSION or content.get('byteorder') != sys.byteorder:
+                return None, None
+
+            system_info = content['system_info']
+            snapshot = {
+                'system_info': [value.encode('utf-8') for value in system_info] if system_info is not None else None,
+                'switch_size': content['switch_size'],
+                'fan_out': content['fan_out']
+            }
+            for name, typecode in SNAPSHOT_TABLES:
+                itemsize, data = content['tables'][name]
+                if itemsize != array(typecode).itemsize:
+                    return None, None
+                snapshot[name] = base64.b64decode(data)
+
+            topology = DeviceTopology.from_snapshot(snapshot, tl1_parser.SystemInfo)
+        except Exception:
+            logging.getLogger(__name__).warning('Failed to load topology snapshot of {0}'.format(key), exc_info=True)
+            return None, None
+
+        self.loaded_count += 1
+        return topology, content['time']
+
+    def get_statistics(self):
+        return {
+            'enabled': self.enabled,
+            'saved': self.saved_count,
+            'written': self.written_count,
+            'loaded': self.loaded_count
+        }
+
+
+snapshots = TopologySnapshotStore()
@@ -8,6 +8,11 @@ from common.helper.system_helper import get_file_folder
 from common.server_connection import ServerConnection
 from common.request_manager import RequestManager
 from common.request_handler import RequestHandler
+from glimmerglass.adaptive_timeouts import command_timeouts
+from glimmerglass.command_statistics import statistics
+from glimmerglass.glimmerglass_request_handler import GlimmerglassRequestHandler
+from glimmerglass.server_relay import ServerRelay
+from glimmerglass.topology_snapshot import snapshots
 
 from cloudshell.core.logger.qs_logger import get_qs_logger
 
@@ -25,19 +30,36 @@ if __name__ == '__main__':
     ConfigurationParser.set_root_folder(exe_folder_str)
     ConfigurationParser.init()
 
-    request_handler = RequestHandler()
+    statistics_settings = ConfigurationParser.get("driver_variable", "statistics") or dict()
+    statistics.configure(dump_folder=os.environ['LOG_PATH'], **statistics_settings)
+
+    timeouts_settings = ConfigurationParser.get("driver_variable", "adaptive_timeouts") or dict()
+    command_timeouts.configure(save_folder=os.environ['LOG_PATH'], **timeouts_settings)
+
+    snapshot_settings = ConfigurationParser.get("driver_variable", "topology_snapshot") or dict()
+    snapshots.configure(folder=os.path.join(exe_folder_str, '..', 'Topology'), **snapshot_settings)
+
+    request_handler = GlimmerglassRequestHandler()
 
     request_manager = RequestManager()
     request_manager.bind_command('login', (RequestHandler.login, request_handler))
     request_manager.bind_command('getresourcedescription', (RequestHandler.get_resource_description, request_handler))
     request_manager.bind_command('setstateid', (RequestHandler.set_state_id, request_handler))
     request_manager.bind_command('getstateid', (RequestHandler.get_state_id, request_handler))
+    request_manager.bind_command('getstats', (GlimmerglassRequestHandler.get_stats, request_handler))
+    request_manager.bind_command('refreshtopology', (GlimmerglassRequestHandler.refresh_topology, request_handler))
     request_manager.bind_command('mapuni', (RequestHandler.map_uni, request_handler))
     request_manager.bind_command('mapbidi', (RequestHandler.map_bidi, request_handler))
     request_manager.bind_command('mapclearto', (RequestHandler.map_clear_to, request_handler))
     request_manager.bind_command('mapclear', (RequestHandler.map_clear, request_handler))
+    request_manager.bind_command('applyrouteset', (GlimmerglassRequestHandler.apply_route_set, request_handler))
     request_manager.bind_command('setspeedmanual', (RequestHandler.set_speed_manual, request_handler))
 
-    server_connection = ServerConnection(host, port, request_manager, exe_folder_str)
+    server_settings = ConfigurationParser.get("driver_variable", "server") or dict()
+    if server_settings.get("connections", 1) > 1:
+        server_relay = ServerRelay(host, port, request_manager, exe_folder_str, **server_settings)
+        server_relay.start_listening()
+    else:
+        server_connection = ServerConnection(host, port, request_manager, exe_folder_str)
 
-    server_connection.start_listeninig()
+        server_connection.start_listeninig()